@@ -27,6 +27,7 @@ import shlex
 import signal
 import subprocess
 import threading
+from operator import itemgetter
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
@@ -36,6 +37,11 @@ try:
 except Exception:
     pd = None  # type: ignore
 
+try:
+    import polars as pl  # Optional (multithreaded CSV parser, opt-in via USE_POLARS)
+except Exception:
+    pl = None  # type: ignore
+
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import font as tkfont
@@ -83,6 +89,7 @@ MAX_COL_W              = 380
 SYNC_SYMBOL            = "⟳"
 SYNC_HOTKEY            = "<Control-r>"
 PREFER_PANDAS          = True
+USE_POLARS             = os.environ.get("RICHMAN_USE_POLARS", "0") == "1"   # opt-in, needs polars
 STARTUP_CSV            = os.environ.get(
     "RICHMAN_STARTUP_CSV",
     r"C:\Users\MKM\Desktop\lptool\app\data\simple_txs_overview.csv"
@@ -166,6 +173,18 @@ def clean_value(v: object) -> str:
     return "" if s.strip().lower() in {"nan", "none"} else s
 
 
+def row_getter(cols: List[str]):
+    """Return a callable giving a record's values for cols, in order (missing keys give "")."""
+    getter = itemgetter(*cols) if len(cols) > 1 else (lambda r: tuple(r.get(c, "") for c in cols))
+
+    def values(row: Dict[str, str]):
+        try:
+            return getter(row)  # one C call; every loaded record carries every column key
+        except KeyError:
+            return [row.get(c, "") for c in cols]
+    return values
+
+
 APP_DIR = app_dir()
 CONFIG_PATH = APP_DIR / CONFIG_FILENAME
 DEFAULT_SESSION_PATH = APP_DIR / DEFAULT_SESSION_NAME
@@ -356,6 +375,7 @@ class AmberRunner(tk.Tk):
         self.reader_thread: threading.Thread | None = None
         self.q = queue.Queue()
         self._sort_state = {}
+        self._tree_rows: List[Dict[str, str]] = []
         self._session_loaded = False
         self._last_started_button: Optional[int] = None
 
@@ -1071,13 +1091,29 @@ class AmberRunner(tk.Tk):
         except Exception:
             pass
 
+    @staticmethod
+    def _records_from_columns(cols: list[str], columns: list[list[str]]) -> list[dict[str, str]]:
+        # Clean column-wise (each distinct value once), then zip the columns into records
+        cleaned = []
+        for vals in columns:
+            memo: dict[str, str] = {}
+            cleaned.append([memo[v] if v in memo else memo.setdefault(v, clean_value(v)) for v in vals])
+        return [dict(zip(cols, row)) for row in zip(*cleaned)]
+
     def _read_csv_records(self, path: str) -> tuple[list[str], list[dict[str, str]]]:
+        if USE_POLARS and (pl is not None):
+            try:
+                # All columns as strings; empty cells stay "" like the pandas path
+                df = pl.read_csv(path, infer_schema_length=0, missing_utf8_is_empty_string=True)
+                cols = [str(c) for c in df.columns]
+                return cols, self._records_from_columns(cols, [df.get_column(c).to_list() for c in df.columns])
+            except Exception:
+                pass  # e.g. duplicate headers: fall back to pandas/csv below
         if PREFER_PANDAS and (pd is not None):
+            # na_filter=False already yields "" for empty cells, so no fillna copy is needed
             df = pd.read_csv(path, dtype=str, keep_default_na=False, na_filter=False)
-            df = df.fillna("")
             cols = [str(c) for c in df.columns]
-            recs = [{c: clean_value(v) for c, v in row.items()} for row in df.to_dict(orient="records")]
-            return cols, recs
+            return cols, self._records_from_columns(cols, [df[c].tolist() for c in df.columns])
         with open(path, "r", newline="", encoding="utf-8") as f:
             try:
                 sample = f.read(4096)
@@ -1124,6 +1160,7 @@ class AmberRunner(tk.Tk):
         self.data_full = None
         self.data_view = None
         self.columns = []
+        self._tree_rows = []
         if hasattr(self, "tree"):
             for i in self.tree.get_children():
                 self.tree.delete(i)
@@ -1152,29 +1189,48 @@ class AmberRunner(tk.Tk):
             return
         try:
             with open(path, "w", newline="", encoding="utf-8") as f:
-                w = csv.DictWriter(f, fieldnames=self.columns)
-                w.writeheader()
-                for row in dataset:
-                    w.writerow({k: clean_value(row.get(k, "")) for k in self.columns})
+                # Records are already cleaned on load: stream them through writerows, projecting
+                # self.columns per row (extras like a DictReader None key are skipped)
+                w = csv.writer(f)
+                w.writerow(self.columns)
+                w.writerows(map(row_getter(self.columns), dataset))
             self.status.set(f"Exported table to {os.path.basename(path)}")
         except Exception as e:
             messagebox.showerror("Export Error", str(e))
 
     def _populate_tree(self) -> None:
         dataset = self.data_view or []
-        self.tree["columns"] = self.columns
-
-        for c in self.columns:
-            self.tree.heading(c, text=c)
-            self.tree.column(c, width=max(MIN_COL_W, min(MAX_COL_W, int(len(c) * COL_CHAR_PX))), anchor="w")
-
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-
-        for idx, row in enumerate(dataset[:MAX_TREE_ROWS]):
-            tag = "odd" if idx % 2 else "even"
-            values = [clean_value(row.get(c, "")) for c in self.columns]
-            self.tree.insert("", "end", values=values, tags=(tag,))
+        children = self.tree.get_children()
+        # Search/sort/sync keep the same columns: only a new header rebuilds them (and their
+        # widths), so a refresh costs the rows alone
+        if tuple(self.tree["columns"]) != tuple(self.columns):
+            self.tree["columns"] = self.columns
+            for c in self.columns:
+                self.tree.heading(c, text=c)
+                self.tree.column(c, width=max(MIN_COL_W, min(MAX_COL_W, int(len(c) * COL_CHAR_PX))), anchor="w")
+            if children:
+                self.tree.delete(*children)  # one Tcl call instead of one per row
+                children = ()
+
+        # Records are cleaned once in _read_csv_records, so rows go in as-is
+        values = row_getter(self.columns)
+        # Row position doubles as item id, so a selection maps straight back to its record
+        self._tree_rows = dataset[:MAX_TREE_ROWS]
+        n = len(self._tree_rows)
+        # Same columns: existing items (iid "0".."k-1", parity tags fixed) get new values in
+        # place; only the surplus is deleted or the shortfall inserted
+        if children:
+            self.tree.selection_remove(self.tree.selection())
+            item = self.tree.item
+            for iid, row in zip(children, self._tree_rows):
+                item(iid, values=values(row))
+            if len(children) > n:
+                self.tree.delete(*children[n:])
+            self.tree.yview_moveto(0.0)
+        insert = self.tree.insert
+        for idx in range(len(children), n):
+            row = self._tree_rows[idx]
+            insert("", "end", iid=str(idx), values=values(row), tags=("odd" if idx % 2 else "even",))
 
         self.tree.tag_configure("odd", background=self.P["INK"])
         self.tree.tag_configure("even", background=self.P["ROW_ALT"])
@@ -1267,8 +1323,11 @@ class AmberRunner(tk.Tk):
         if not sel:
             return
         item = sel[0]
-        vals = self.tree.item(item, "values")
-        row = {k: clean_value(vals[i] if i < len(vals) else "") for i, k in enumerate(self.columns)}
+        try:
+            row = self._tree_rows[int(item)]  # O(1), no Tcl round-trip for the values
+        except (ValueError, IndexError):
+            vals = self.tree.item(item, "values")
+            row = {k: clean_value(vals[i] if i < len(vals) else "") for i, k in enumerate(self.columns)}
         self.txs_text.delete("1.0", "end")
         self.txs_text.insert("end", self._format_txs_detail(row))
 
@@ -1484,13 +1543,17 @@ class AmberRunner(tk.Tk):
             pass
 
     def _drain_terminal_queue(self):
+        # The reader queues single characters: collect everything pending and hand it to the
+        # Text widget in one insert + one see instead of two Tcl calls per character
+        chunks: List[str] = []
         try:
             while True:
-                ch = self.q.get_nowait()
-                self.term_text.insert("end", ch)
-                self.term_text.see("end")
+                chunks.append(self.q.get_nowait())
         except queue.Empty:
             pass
+        if chunks:
+            self.term_text.insert("end", "".join(chunks))
+            self.term_text.see("end")
         if self.proc and self.proc.poll() is None:
             self.after(20, self._drain_terminal_queue)
 
@@ -1,4 +1,4 @@
-# Software Version 1.2
+# Software Version 1.9
 # NOTE: Every time you (or a future AI) modify this script, 
 #       please increment the Software Version above to keep track of updates.
 
@@ -7,8 +7,22 @@ import requests
 import os
 import time
 import re
+from contextlib import ExitStack
+from operator import itemgetter
 from datetime import datetime, timedelta, timezone
 
+try:
+    import orjson  # Optional (faster decoding of large txlist pages)
+    _json_loads = orjson.loads
+except Exception:
+    import json
+    _json_loads = json.loads
+
+try:
+    import numpy as np  # Optional (vectorized timestamp filter for large pages)
+except Exception:
+    np = None  # type: ignore
+
 """
 Linea wallet raw fetcher (timeframe-enabled, no block lookups)
 - Fetch last N normal transactions OR a timeframe from now
@@ -35,6 +49,12 @@ DATA_DIR = os.path.join(ROOT_DIR, "database")
 os.makedirs(DATA_DIR, exist_ok=True)
 
 RAW_CSV_FILENAME = os.path.join(DATA_DIR, "data_raw_txs.csv")
+
+# txlist page size: the first large request of a run probes whether the key accepts
+# MAX_OFFSET_PROBE and caches the answer. Set ETHERSCAN_MAX_OFFSET (e.g. 1000) on
+# restricted keys to skip the probe.
+MAX_OFFSET_PROBE = 10000
+FALLBACK_OFFSET = 1000
 # ==========================
 
 # Minimal console output
@@ -48,11 +68,13 @@ session = requests.Session()
 # ---- API helper
 
 def _get(params: dict):
-    params = {**params, "chainid": CHAIN_ID, "apikey": API_KEY}
+    # Callers that reuse a pre-merged dict (see _TXLIST_PARAMS) skip the copy
+    if "apikey" not in params:
+        params = {**params, "chainid": CHAIN_ID, "apikey": API_KEY}
     for attempt in range(4):
         r = session.get(BASE_URL, params=params, timeout=40)
         if r.status_code == 200:
-            data = r.json()
+            data = _json_loads(r.content)
             # handle rate limiting gently
             if (
                 data.get("message") == "NOTOK"
@@ -66,49 +88,105 @@ def _get(params: dict):
     r.raise_for_status()
     return r.json()
 
+_MAX_OFFSET = int(os.getenv("ETHERSCAN_MAX_OFFSET", "0") or 0) or None
+
+# Constant part of every account.txlist request (already merged with chainid/apikey)
+_TXLIST_PARAMS = {
+    "module": "account",
+    "action": "txlist",
+    "startblock": 0,
+    "endblock": 99999999,
+    "sort": "desc",  # newest first
+    "chainid": CHAIN_ID,
+    "apikey": API_KEY,
+}
+
+def _txlist_params(wallet: str) -> dict:
+    """Fresh txlist params for one wallet; _txlist only updates page/offset on it."""
+    return {**_TXLIST_PARAMS, "address": wallet}
+
+def _offset_rejected(data: dict) -> bool:
+    """True if the API refused the call outright (not an empty / no-transactions answer)."""
+    if data.get("status") == "1":
+        return False
+    if (data.get("message") or "").lower().startswith("no transactions"):
+        return False
+    res = data.get("result")
+    return not (isinstance(res, list) and not res)
+
+def _txlist(params: dict, page: int, offset: int):
+    """
+    One account.txlist call (newest first) on params from _txlist_params().
+    Returns (data, offset actually used).
+    The first call above FALLBACK_OFFSET doubles as the page-size probe.
+    """
+    global _MAX_OFFSET
+    if _MAX_OFFSET is not None:
+        offset = min(offset, _MAX_OFFSET)
+    params["page"] = page
+    params["offset"] = offset
+    data = _get(params)
+    if _MAX_OFFSET is None and offset > FALLBACK_OFFSET:
+        if _offset_rejected(data):
+            _MAX_OFFSET = FALLBACK_OFFSET
+            return _txlist(params, page, offset)
+        if offset >= MAX_OFFSET_PROBE:
+            _MAX_OFFSET = MAX_OFFSET_PROBE
+    return data, offset
+
 def fetch_last_normal_txs(wallet: str, limit: int):
-    data = _get({
-        "module": "account",
-        "action": "txlist",
-        "address": wallet,
-        "startblock": 0,
-        "endblock": 99999999,
-        "page": 1,
-        "offset": limit,
-        "sort": "desc",
-    })
+    data, _ = _txlist(_txlist_params(wallet), 1, limit)
     if data.get("status") == "1":
         return data["result"]
     if (data.get("message") or "").lower().startswith("no transactions found"):
         return []
     raise RuntimeError(f"API error: {data.get('message')} - {data.get('result')}")
 
+def _tx_ts(tx: dict) -> int:
+    try:
+        return int(tx.get("timeStamp") or tx.get("timestamp") or 0)
+    except Exception:
+        return 0
+
+# Below this many items the plain loop is as fast as building a numpy array
+NUMPY_MIN_PAGE = 1000
+
+def _filter_page(page_items: list, start_ts: int, end_ts: int):
+    """Return (items with start_ts <= ts <= end_ts, oldest ts on the page) for a non-empty page."""
+    if np is not None and len(page_items) >= NUMPY_MIN_PAGE:
+        ts_arr = np.fromiter(map(_tx_ts, page_items), dtype=np.int64, count=len(page_items))
+        idxs = np.flatnonzero((ts_arr >= start_ts) & (ts_arr <= end_ts))
+        return [page_items[i] for i in idxs], int(ts_arr.min())
+
+    oldest = None
+    in_range = []
+    for tx in page_items:
+        ts = _tx_ts(tx)
+        if oldest is None or ts < oldest:
+            oldest = ts
+        if start_ts <= ts <= end_ts:
+            in_range.append(tx)
+    return in_range, oldest
+
 def fetch_timeframe_txs(wallet: str, start_ts: int, end_ts: int):
     """
-    Fetch transactions whose timestamp is in [start_ts, end_ts] WITHOUT using getblocknobytime.
+    Yield pages of transactions whose timestamp is in [start_ts, end_ts] WITHOUT using getblocknobytime.
     Strategy:
       - page through account.txlist sorted DESC (newest first)
-      - collect items whose timeStamp is within [start_ts, end_ts]
+      - yield the items of each page whose timeStamp is within [start_ts, end_ts]
       - stop once the last item on a page is older than start_ts
+    Pages are yielded as they arrive (newest-first), so callers can write them out
+    without holding the whole range in memory.
     """
     if start_ts > end_ts:
         start_ts, end_ts = end_ts, start_ts
 
     page = 1
-    per_page = 1000  # conservative; increase if you know your key supports it
-    collected = []
+    per_page = _MAX_OFFSET or MAX_OFFSET_PROBE  # probed on first call if not known yet
+    params = _txlist_params(wallet)  # one dict, page/offset updated in place
 
     while True:
-        data = _get({
-            "module": "account",
-            "action": "txlist",
-            "address": wallet,
-            "startblock": 0,
-            "endblock": 99999999,
-            "page": page,
-            "offset": per_page,
-            "sort": "desc",  # newest first
-        })
+        data, per_page = _txlist(params, page, per_page)
 
         # Handle "no transactions" gracefully
         if data.get("status") == "0" and (data.get("message") or "").lower().startswith("no transactions"):
@@ -124,20 +202,11 @@ def fetch_timeframe_txs(wallet: str, start_ts: int, end_ts: int):
         if not page_items:
             break
 
-        # Track oldest timestamp on this page to decide if we can stop paging
-        oldest_ts_on_page = None
-
-        for tx in page_items:
-            try:
-                ts = int(tx.get("timeStamp") or tx.get("timestamp") or 0)
-            except Exception:
-                ts = 0
-
-            if oldest_ts_on_page is None or ts < oldest_ts_on_page:
-                oldest_ts_on_page = ts
+        # Oldest timestamp on this page decides if we can stop paging
+        in_range, oldest_ts_on_page = _filter_page(page_items, start_ts, end_ts)
 
-            if start_ts <= ts <= end_ts:
-                collected.append(tx)
+        if in_range:
+            yield in_range
 
         # If the oldest tx on this page is already older than our start cutoff, we can stop.
         if oldest_ts_on_page is not None and oldest_ts_on_page < start_ts:
@@ -150,10 +219,6 @@ def fetch_timeframe_txs(wallet: str, start_ts: int, end_ts: int):
         page += 1
         time.sleep(0.2)  # be polite to the API
 
-    # Return newest-first
-    collected.sort(key=lambda x: int(x.get("timeStamp", x.get("timestamp", "0"))), reverse=True)
-    return collected
-
 # ---- Parsing
 
 DUR_PATTERN = re.compile(
@@ -235,12 +300,17 @@ def parse_timeframe(s: str):
     if not s:
         return ("count", 50)
 
+    # 0) Bare integer "50" (the common case): skip the regexes entirely.
+    #    isascii() guards against digit-like chars such as "²" that int() rejects.
+    if s.isascii() and s.isdigit():
+        return ("count", int(s))
+
     # 1) Explicit absolute range: "A to B", "A - B", "from A to B"
     rng = _try_parse_range(s)
     if rng:
         return ("range", rng[0], rng[1])
 
-    # 2) Count like "50", "last 50"
+    # 2) Count like "last 50", "50 txs"
     m = COUNT_PATTERN.match(s)
     if m:
         return ("count", int(m.group(1)))
@@ -281,11 +351,7 @@ def parse_timeframe(s: str):
         end_ts = int(datetime.now(tz=LOCAL_TZ).timestamp())
         return ("range", int(dt.timestamp()), end_ts)
 
-    # 5) If an integer slipped through without the pattern, treat as count
-    if s.isdigit():
-        return ("count", int(s))
-
-    # 6) Default to last 50 if unrecognized
+    # 5) Default to last 50 if unrecognized
     if not VERBOSE:
         print("Unrecognized input; defaulting to last 50 transactions.", flush=True)
     return ("count", 50)
@@ -305,24 +371,40 @@ def load_existing_hashes(csv_path: str):
                     existing_hashes.add(h)
     return existing_hashes, fieldnames
 
-def append_rows(csv_path: str, rows: list, fieldnames: list | None):
-    if not rows:
-        return 0
+def open_raw_writer(stack: ExitStack, csv_path: str, sample_rows: list, fieldnames: list | None):
+    """
+    Open csv_path for appending (held open by `stack`) and return a DictWriter.
+    If the file has no header yet, fieldnames are taken from sample_rows and a header is written.
+    """
     if fieldnames is None:
         keys = set()
-        for r in rows:
+        for r in sample_rows:
             keys.update(r.keys())
         fieldnames = sorted(keys)
 
     mode = "a" if os.path.exists(csv_path) else "w"
-    with open(csv_path, mode, newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        if mode == "w" or os.stat(csv_path).st_size == 0:
-            w.writeheader()
-        for r in rows:
-            row = {k: r.get(k, "") for k in fieldnames}
-            w.writerow(row)
-    return len(rows)
+    f = stack.enter_context(open(csv_path, mode, newline="", encoding="utf-8"))
+    w = csv.DictWriter(f, fieldnames=fieldnames, restval="", extrasaction="ignore")
+    if mode == "w" or os.stat(csv_path).st_size == 0:
+        w.writeheader()
+    return w
+
+_hash_of = itemgetter("hash")
+
+def filter_new_txs(txs: list, seen: set) -> list:
+    """
+    Keep only txs whose hash is not in `seen`, in one pass.
+    Also drops duplicates within `txs` itself (overlapping pages); `seen` is updated in place.
+    """
+    fresh = []
+    mark = seen.add
+    for tx in txs:
+        h = _hash_of(tx)
+        if h in seen:
+            continue
+        mark(h)
+        fresh.append(tx)
+    return fresh
 
 # ---- main
 
@@ -346,26 +428,37 @@ def main():
         limit = vals[0]
         if VERBOSE:
             print(f"Fetching last {limit} normal transactions for wallet {WALLET_ADDRESS}…", flush=True)
-        txs = fetch_last_normal_txs(WALLET_ADDRESS, limit)
+        pages = [fetch_last_normal_txs(WALLET_ADDRESS, limit)]
     else:
         start_ts, end_ts = vals
         if VERBOSE:
             st = datetime.fromtimestamp(start_ts, tz=LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S %Z")
             et = datetime.fromtimestamp(end_ts, tz=LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S %Z")
             print(f"Fetching transactions for wallet {WALLET_ADDRESS} from {st} to {et}…", flush=True)
-        txs = fetch_timeframe_txs(WALLET_ADDRESS, start_ts, end_ts)
-        if not VERBOSE:
-            print(f"[INFO] Fetched {len(txs)} in range.", flush=True)
+        pages = fetch_timeframe_txs(WALLET_ADDRESS, start_ts, end_ts)
 
     # Load existing raw to avoid duplicates
     existing_hashes, raw_fieldnames = load_existing_hashes(RAW_CSV_FILENAME)
 
-    # Append fetched txs not already saved (by hash)
-    txs_to_append = [tx for tx in txs if tx.get("hash") not in existing_hashes]
-    if VERBOSE:
-        print(f"Will append {len(txs_to_append)} new transactions (skip dups by hash).", flush=True)
-
-    wrote = append_rows(RAW_CSV_FILENAME, txs_to_append, raw_fieldnames)
+    # Append each page as it arrives, skipping txs already saved (by hash) and in-run dupes
+    fetched = 0
+    wrote = 0
+    with ExitStack() as stack:
+        writer = None
+        for page_txs in pages:
+            fetched += len(page_txs)
+            txs_to_append = filter_new_txs(page_txs, existing_hashes)
+            if not txs_to_append:
+                continue
+            if writer is None:
+                writer = open_raw_writer(stack, RAW_CSV_FILENAME, txs_to_append, raw_fieldnames)
+            writer.writerows(txs_to_append)
+            wrote += len(txs_to_append)
+            if VERBOSE:
+                print(f"Appended {len(txs_to_append)} new transactions (skip dups by hash).", flush=True)
+
+    if kind != "count" and not VERBOSE:
+        print(f"[INFO] Fetched {fetched} in range.", flush=True)
 
     if wrote:
         print(f"[INFO] Wrote {wrote} new rows to {RAW_CSV_FILENAME}", flush=True)
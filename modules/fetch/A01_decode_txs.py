@@ -1,5 +1,5 @@
 # A01_decode_txs.py — Linea (CHAIN_ID=59144)
-# Software Version 1.0
+# Software Version 1.24
 # Reads C:\TrueBlocks\database\data_raw_txs.csv (etherscan-style export) and writes:
 #   - C:\TrueBlocks\database\data_decode_txs.csv  (combined: both successful and failed)
 #
@@ -14,16 +14,28 @@
 # - Failed txs still record timestamp + gas; amounts/NFTs blank, type="failed".
 # - NFT symbols enriched via tokennfttx metadata to avoid UNKNOWN for ERC-1155/721.
 # - Writes/merges a single output file (no separate success/failed files).
+#   New rows are spliced in without re-serializing existing ones when they don't interleave.
 # - Prints per-tx info lines: "[INFO] processing Transaction #N" and shows a progress bar.
+# - Receipts are prefetched in JSON-RPC batches; per-tx decoding runs on a small thread pool.
+# - ERC-20 symbol/decimals resolved on-chain persist in database/.block_cache/token_meta.sqlite across runs.
 
-import os, csv, time, string, sys
+import os, time, sys, sqlite3, threading, itertools, shutil
+from functools import lru_cache
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from decimal import Decimal, getcontext
-from eth_abi import decode as abi_decode
+from eth_abi import decode as abi_decode, encode as abi_encode
+try:
+    from eth_abi.registry import registry as _abi_registry
+    from eth_abi.decoding import ContextFramesBytesIO
+except Exception:
+    _abi_registry = None
 from eth_utils import keccak, to_checksum_address
 from pathlib import Path
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --------------------------- Paths / Config ---------------------------
 # Script location: C:\TrueBlocks\modules\fetch
@@ -37,6 +49,12 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # Filenames (absolute via DATA_DIR)
 RAW_CSV = Path(DATA_DIR) / "data_raw_txs.csv"
 OUT_CSV_DECODED = Path(DATA_DIR) / "data_decode_txs.csv"
+TOKEN_META_DB = Path(DATA_DIR) / ".block_cache" / "token_meta.sqlite"  # runtime cache, next to A02/A03's
+
+# Output layout of OUT_CSV_DECODED
+OUT_COLS = ["tx_hash", "tx_timestamp", "block_time", "type",
+            "from_address", "to_address",
+            "amount_sent", "amount_received", "total_gas_eth", "nft_transfere"]
 
 # Chain / API
 WALLET_ADDRESS = "0x4e118f5a1ed501bd0b4eac76c8bd49ed1895bfc8".lower()
@@ -52,8 +70,30 @@ LINEA_RPCS = [
     "https://1rpc.io/linea",
 ]
 
-getcontext().prec = 50
+# A direct RPC endpoint that fails a request is skipped for this many seconds
+RPC_COOLDOWN_S = 30
+
+# Receipts per JSON-RPC batch POST, and threads decoding txs concurrently (the decode is
+# I/O-bound: raise DECODE_WORKERS for more in-flight requests)
+RECEIPT_BATCH_SIZE = 50
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", "8"))
+
+# One pooled keep-alive session for Etherscan and the RPCs. Transient 429/5xx are retried
+# by urllib3 (POST included: every JSON-RPC call here is a read).
 session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=max(32, 4 * DECODE_WORKERS),
+    max_retries=Retry(
+        total=4,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    ),
+)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
 
 # Control detail logging (old [TX#] lines). Keep off to avoid noise.
 VERBOSE_DETAIL = False
@@ -131,6 +171,10 @@ def eth_call(to: str, data: str) -> str:
     return rpc({"action": "eth_call", "to": to, "data": data, "tag": "latest"})
 
 def safe_eth_call(to: str, data: str) -> str | None:
+    """eth_call via the direct RPCs; the rate-limited Etherscan proxy only if every endpoint is down."""
+    res = eth_call_direct_batch([(to, data)])
+    if res is not None:
+        return res[0]
     try:
         return eth_call(to, data)
     except Exception:
@@ -169,7 +213,7 @@ def fetch_tokennfttx_metadata(txhash: str) -> dict:
 # --------------------------- Direct JSON-RPC trace ---------------------------
 def rpc_direct(url: str, method: str, params: list):
     try:
-        r = requests.post(url, json={"jsonrpc":"2.0","id":1,"method":method,"params":params}, timeout=25)
+        r = session.post(url, json={"jsonrpc":"2.0","id":1,"method":method,"params":params}, timeout=25)
         if r.status_code != 200:
             return None
         j = r.json()
@@ -179,6 +223,92 @@ def rpc_direct(url: str, method: str, params: list):
     except Exception:
         return None
 
+def rpc_direct_batch(url: str, calls: list[tuple[str, list]]) -> list | None:
+    """
+    One JSON-RPC batch POST. Returns results in call order (None for entries that
+    errored), or None if the whole request failed.
+    """
+    payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)]
+    try:
+        r = session.post(url, json=payload, timeout=40)
+        if r.status_code != 200:
+            return None
+        j = r.json()
+        if not isinstance(j, list):
+            return None
+        out = [None] * len(calls)
+        for item in j:
+            i = item.get("id") if isinstance(item, dict) else None
+            if isinstance(i, int) and 0 <= i < len(calls) and "error" not in item:
+                out[i] = item.get("result")
+        return out
+    except Exception:
+        return None
+
+_rpc_rr = itertools.count()
+_rpc_down_until: dict[str, float] = {}
+
+def rpc_endpoints() -> list[str]:
+    """LINEA_RPCS rotated round-robin per call, endpoints in cooldown moved to the back."""
+    start = next(_rpc_rr) % len(LINEA_RPCS)
+    order = LINEA_RPCS[start:] + LINEA_RPCS[:start]
+    now = time.monotonic()
+    healthy = [u for u in order if _rpc_down_until.get(u, 0.0) <= now]
+    return healthy + [u for u in order if u not in healthy]
+
+def _mark_rpc(url: str, ok: bool):
+    if ok:
+        _rpc_down_until.pop(url, None)
+    else:
+        _rpc_down_until[url] = time.monotonic() + RPC_COOLDOWN_S
+
+def eth_call_direct_batch(calls: list[tuple[str, str]]) -> list[str | None] | None:
+    """
+    [(to, data), ...] as one JSON-RPC batch of eth_call on the first healthy endpoint.
+    Returns results in order (None where a call reverted), or None if no endpoint answered.
+    """
+    if not calls:
+        return []
+    batch = [("eth_call", [{"to": to, "data": data}, "latest"]) for to, data in calls]
+    for url in rpc_endpoints():
+        res = rpc_direct_batch(url, batch)
+        _mark_rpc(url, res is not None)
+        if res is not None:
+            return res
+    return None
+
+def get_tx_receipts_batch(txhashes: list[str]) -> dict[str, dict]:
+    """{txhash: receipt} via batched eth_getTransactionReceipt; misses are left out (callers fall back to get_tx_receipt)."""
+    out: dict[str, dict] = {}
+    for url in rpc_endpoints():
+        todo = [h for h in txhashes if h not in out]
+        if not todo:
+            break
+        res = rpc_direct_batch(url, [("eth_getTransactionReceipt", [h]) for h in todo])
+        _mark_rpc(url, res is not None)
+        if not res:
+            continue
+        for h, rc in zip(todo, res):
+            if isinstance(rc, dict):
+                out[h] = rc
+    return out
+
+def get_block_timestamps_batch(block_numbers: list[int]) -> dict[int, int]:
+    """{block_number: unix_ts} via batched eth_getBlockByNumber (no tx bodies); misses are left out."""
+    out: dict[int, int] = {}
+    for url in rpc_endpoints():
+        todo = [n for n in block_numbers if n not in out]
+        if not todo:
+            break
+        res = rpc_direct_batch(url, [("eth_getBlockByNumber", [hex(n), False]) for n in todo])
+        _mark_rpc(url, res is not None)
+        if not res:
+            continue
+        for n, blk in zip(todo, res):
+            if isinstance(blk, dict) and h2i(blk.get("timestamp")):
+                out[n] = h2i(blk.get("timestamp"))
+    return out
+
 def trace_eth_delta(txhash: str, wallet: str) -> int | None:
     wl = (wallet or "").lower()
     for url in LINEA_RPCS:
@@ -207,60 +337,96 @@ def trace_eth_delta(txhash: str, wallet: str) -> int | None:
     return None
 
 # --------------------------- hex/topic utils ---------------------------
-_HEXCHARS = set(string.hexdigits)
+# RPC returns are trusted to be hex: is_hex_data only checks shape. Set HEX_STRICT=1 to
+# also validate every character (debugging odd endpoints).
+_HEX_STRICT = os.getenv("HEX_STRICT", "") not in ("", "0")
+
 def is_hex_data(s: str) -> bool:
-    if not isinstance(s, str) or not s.startswith("0x"):
-        return False
-    payload = s[2:]
-    if len(payload) == 0:
-        return True
-    if len(payload) % 2 != 0:
+    if not isinstance(s, str) or not s.startswith("0x") or len(s) % 2 != 0:
         return False
-    return all(c in _HEXCHARS for c in payload)
+    if _HEX_STRICT:
+        try:
+            bytes.fromhex(s[2:])
+        except ValueError:
+            return False
+    return True
 
 def address_from_topic(topic_hex: str) -> str:
-    try:
-        s = "0x" + topic_hex[-40:]
-        return to_checksum_address(s).lower()
-    except Exception:
+    """Lowercase address from a 32-byte topic (no checksum round-trip; callers compare lowercase)."""
+    if not isinstance(topic_hex, str) or len(topic_hex) < 40:
         return ""
+    return "0x" + topic_hex[-40:].lower()
 
 def h2i(x: str | None) -> int:
     if not x or x == "0x":
         return 0
     return int(x, 16)
 
+@lru_cache(maxsize=8192)
+def _checksum_cached(addr: str) -> str:
+    """to_checksum_address keyed by the lowercase address (one keccak per distinct address)."""
+    return to_checksum_address(addr)
+
 def decode_address(addr: str | None) -> str:
     """Return EIP-55 checksummed address or empty string if invalid."""
     s = (addr or "").strip()
     if not s or not s.startswith("0x") or len(s) != 42:
         return ""
     try:
-        return to_checksum_address(s)
+        return _checksum_cached(s.lower())
     except Exception:
         return ""
 
 # --------------------------- topics ---------------------------
-TOPIC_TRANSFER              = "0x" + keccak(text="Transfer(address,address,uint256)").hex()  # ERC20/721
-TOPIC_TRANSFER_SINGLE       = "0x" + keccak(text="TransferSingle(address,address,address,uint256,uint256)").hex()  # ERC1155
-TOPIC_WETH_DEPOSIT          = "0x" + keccak(text="Deposit(address,uint256)").hex()
-TOPIC_WETH_WITHDRAWAL       = "0x" + keccak(text="Withdrawal(address,uint256)").hex()
+# keccak256 of the event signatures, precomputed (checked once against keccak below)
+TOPIC_TRANSFER              = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"  # ERC20/721
+TOPIC_TRANSFER_SINGLE       = "0xc3d58168c5ae7397731d063d5bbf3d657854427343f4c083240f7aacaa2d0f62"  # ERC1155
+TOPIC_WETH_DEPOSIT          = "0xe1fffcc4923d04b559f4d29a8bfc6cda04eb5b0d3c460751c2402c5c5cc9109c"
+TOPIC_WETH_WITHDRAWAL       = "0x7fcf532c15f0a6db0bd6d0e038bea71d30d808c7d98cb3bf7268a95bf5081b65"
 
 # Uniswap-ish topics for classification
-TOPIC_SWAP_V3    = "0x" + keccak(text="Swap(address,address,int256,int256,uint160,uint128,int24)").hex()
-TOPIC_MINT_V3    = "0x" + keccak(text="Mint(address,address,int24,int24,uint128,uint256,uint256)").hex()
-TOPIC_BURN_V3    = "0x" + keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)").hex()
-TOPIC_INC_LIQ_V3 = "0x" + keccak(text="IncreaseLiquidity(uint256,uint128,uint256,uint256)").hex()
-TOPIC_DEC_LIQ_V3 = "0x" + keccak(text="DecreaseLiquidity(uint256,uint128,uint256,uint256)").hex()
-TOPIC_SWAP_V2    = "0x" + keccak(text="Swap(address,uint256,uint256,uint256,uint256,address)").hex()
-TOPIC_MINT_V2    = "0x" + keccak(text="Mint(address,uint256,uint256)").hex()
-TOPIC_BURN_V2    = "0x" + keccak(text="Burn(address,uint256,uint256,address)").hex()
+TOPIC_SWAP_V3    = "0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67"
+TOPIC_MINT_V3    = "0x7a53080ba414158be7ec69b987b5fb7d07dee101fe85488f0853ae16239d0bde"
+TOPIC_BURN_V3    = "0x0c396cd989a39f4459b5fa1aed6a9a8dcdbc45908acfd67e028cd568da98982c"
+TOPIC_INC_LIQ_V3 = "0x3067048beee31b25b2f1681f88dac838c8bba36af25bfb2b7cf7473a5847e35f"
+TOPIC_DEC_LIQ_V3 = "0x26f6a048ee9138f2c0ce266f322cb99228e8d619ae2bff30c67f8dcf9d2377b4"
+TOPIC_SWAP_V2    = "0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822"
+TOPIC_MINT_V2    = "0x4c209b5fc8ad50758f13e2e1088ba56a560dff690a1c6fef26394f4c03821c4f"
+TOPIC_BURN_V2    = "0xdccd412f0b1252819cb1fd330b93224ca42612892bb3f4f789976e6d81936496"
+
+_TOPIC_SIGNATURES = {
+    TOPIC_TRANSFER: "Transfer(address,address,uint256)",
+    TOPIC_TRANSFER_SINGLE: "TransferSingle(address,address,address,uint256,uint256)",
+    TOPIC_WETH_DEPOSIT: "Deposit(address,uint256)",
+    TOPIC_WETH_WITHDRAWAL: "Withdrawal(address,uint256)",
+    TOPIC_SWAP_V3: "Swap(address,address,int256,int256,uint160,uint128,int24)",
+    TOPIC_MINT_V3: "Mint(address,address,int24,int24,uint128,uint256,uint256)",
+    TOPIC_BURN_V3: "Burn(address,int24,int24,uint128,uint256,uint256)",
+    TOPIC_INC_LIQ_V3: "IncreaseLiquidity(uint256,uint128,uint256,uint256)",
+    TOPIC_DEC_LIQ_V3: "DecreaseLiquidity(uint256,uint128,uint256,uint256)",
+    TOPIC_SWAP_V2: "Swap(address,uint256,uint256,uint256,uint256,address)",
+    TOPIC_MINT_V2: "Mint(address,uint256,uint256)",
+    TOPIC_BURN_V2: "Burn(address,uint256,uint256,address)",
+}
+for _topic, _sig in _TOPIC_SIGNATURES.items():
+    assert "0x" + keccak(text=_sig).hex() == _topic, _sig
+
+# Topic sets: logs outside _DELTA_TOPICS never move wallet balances
+_DELTA_TOPICS = frozenset({TOPIC_TRANSFER, TOPIC_TRANSFER_SINGLE, TOPIC_WETH_DEPOSIT, TOPIC_WETH_WITHDRAWAL})
+_TOKEN_TOPICS = frozenset({TOPIC_TRANSFER, TOPIC_TRANSFER_SINGLE})  # the only logs that need token metadata
+_SWAP_TOPICS = frozenset({TOPIC_SWAP_V3, TOPIC_SWAP_V2})
+_ADD_LIQ_TOPICS = frozenset({TOPIC_MINT_V3, TOPIC_INC_LIQ_V3, TOPIC_MINT_V2})
+_REMOVE_LIQ_TOPICS = frozenset({TOPIC_BURN_V3, TOPIC_DEC_LIQ_V3, TOPIC_BURN_V2})
 
 # --------------------------- ERC-20 metadata ---------------------------
 SEL_SYMBOL   = "0x95d89b41"
 SEL_DECIMALS = "0x313ce567"
 SEL_NAME     = "0x06fdde03"
 
+# Multicall3 (same address on Linea as on every other chain it is deployed to)
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+SEL_AGGREGATE3     = "0x82ad56cb"  # aggregate3((address,bool,bytes)[])
+
 SYMBOL_ALIASES = {
     "wrapped btc": "WBTC",
     "wbtc.e": "WBTC",
@@ -272,15 +438,105 @@ DECIMALS_BY_SYMBOL = {
 _symbol_cache: dict[str, str] = {}
 _dec_cache: dict[str, int] = {}
 
+def _abi_decoder(*types: str):
+    """Build the eth_abi decoder for `types` once; returns raw -> tuple (plain abi_decode as fallback)."""
+    if _abi_registry is not None:
+        try:
+            dec = _abi_registry.get_decoder("(" + ",".join(types) + ")")
+            return lambda raw: dec(ContextFramesBytesIO(raw))
+        except Exception:
+            pass
+    return lambda raw: abi_decode(list(types), raw)
+
+_DEC_STRING = _abi_decoder("string")
+_DEC_BYTES32 = _abi_decoder("bytes32")
+_DEC_UINT8 = _abi_decoder("uint8")
+_DEC_AGGREGATE3 = _abi_decoder("(bool,bytes)[]")
+
+# --------------------------- persistent token cache ---------------------------
+# Only values actually read on-chain are persisted; fallbacks (UNKNOWN / 18) stay per-run.
+TOKEN_CACHE_FLUSH_EVERY = 64
+_token_cache_pending: dict[str, dict] = {}
+_token_cache_lock = threading.Lock()
+
+def _token_db():
+    TOKEN_META_DB.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(TOKEN_META_DB)
+    con.execute("CREATE TABLE IF NOT EXISTS tokens (addr TEXT PRIMARY KEY, symbol TEXT, decimals INTEGER, ts INTEGER)")
+    return con
+
+def load_token_cache():
+    """Seed _symbol_cache/_dec_cache from TOKEN_META_DB (missing decimals filled from DECIMALS_BY_SYMBOL)."""
+    if not TOKEN_META_DB.exists():
+        return
+    try:
+        con = _token_db()
+        try:
+            rows = con.execute("SELECT addr, symbol, decimals FROM tokens").fetchall()
+        finally:
+            con.close()
+    except Exception:
+        return
+    for addr, sym, dec in rows:
+        if sym:
+            _symbol_cache[addr] = sym
+        if dec is None and sym:
+            dec = DECIMALS_BY_SYMBOL.get(sym.upper())
+        if isinstance(dec, int):
+            _dec_cache[addr] = dec
+
+def flush_token_cache():
+    """Write queued on-chain lookups to TOKEN_META_DB in one executemany."""
+    with _token_cache_lock:
+        if not _token_cache_pending:
+            return
+        batch = [(a, v.get("symbol"), v.get("decimals"), int(time.time())) for a, v in _token_cache_pending.items()]
+        _token_cache_pending.clear()
+    try:
+        con = _token_db()
+        try:
+            with con:
+                con.executemany(
+                    "INSERT INTO tokens (addr, symbol, decimals, ts) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(addr) DO UPDATE SET "
+                    "symbol = COALESCE(excluded.symbol, symbol), "
+                    "decimals = COALESCE(excluded.decimals, decimals), ts = excluded.ts",
+                    batch,
+                )
+        finally:
+            con.close()
+    except Exception:
+        pass
+
+def _remember_token(addr_lower: str, **fields):
+    with _token_cache_lock:
+        _token_cache_pending.setdefault(addr_lower, {}).update(fields)
+        due = len(_token_cache_pending) >= TOKEN_CACHE_FLUSH_EVERY
+    if due:
+        flush_token_cache()
+
 def decode_string_return(hexdata: str) -> str | None:
     if not is_hex_data(hexdata) or hexdata == "0x":
         return None
-    raw = bytes.fromhex(hexdata[2:])
     try:
-        return abi_decode(["string"], raw)[0]
+        raw = bytes.fromhex(hexdata[2:])
+    except ValueError:
+        return None
+    # Fast paths: bare bytes32 (MKR-style symbols) and the canonical (offset=0x20, len, data) string
+    if len(raw) == 32:
+        return raw.rstrip(b"\x00").decode("utf-8", errors="replace")
+    if len(raw) >= 64 and int.from_bytes(raw[:32], "big") == 32:
+        n = int.from_bytes(raw[32:64], "big")
+        if 64 + -(-n // 32) * 32 <= len(raw):  # padded payload present
+            try:
+                return raw[64:64 + n].decode("utf-8")
+            except UnicodeDecodeError:
+                pass
+    try:
+        return _DEC_STRING(raw)[0]
     except Exception:
         try:
-            b = abi_decode(["bytes32"], raw)[0]
+            b = _DEC_BYTES32(raw)[0]
             return b.rstrip(b"\x00").decode("utf-8", errors="replace")
         except Exception:
             return None
@@ -292,6 +548,22 @@ def normalize_symbol(sym: str) -> str:
     alias = SYMBOL_ALIASES.get(s.lower())
     return alias or s
 
+def _symbol_from_return(res: str | None) -> str | None:
+    if not is_hex_data(res or ""):
+        return None
+    s = decode_string_return(res)
+    if s and s.isprintable():
+        return normalize_symbol(s)
+    return None
+
+def _decimals_from_return(res: str | None) -> int | None:
+    if not is_hex_data(res or "") or res == "0x":
+        return None
+    try:
+        return int(_DEC_UINT8(bytes.fromhex(res[2:]))[0])
+    except Exception:
+        return None
+
 def erc20_symbol(addr: str, meta_hint: dict | None = None) -> str:
     a = addr.lower()
     if meta_hint and a in meta_hint and meta_hint[a].get("symbol"):
@@ -299,13 +571,10 @@ def erc20_symbol(addr: str, meta_hint: dict | None = None) -> str:
     if a in _symbol_cache:
         return _symbol_cache[a]
     for sel in (SEL_SYMBOL, SEL_NAME):
-        res = safe_eth_call(addr, sel)
-        if not is_hex_data(res or ""):
-            continue
-        s = decode_string_return(res)
-        if s and s.isprintable():
-            s = normalize_symbol(s)
+        s = _symbol_from_return(safe_eth_call(addr, sel))
+        if s:
             _symbol_cache[a] = s
+            _remember_token(a, symbol=s)
             return s
     _symbol_cache[a] = "UNKNOWN"
     return "UNKNOWN"
@@ -318,14 +587,11 @@ def erc20_decimals(addr: str, meta_hint: dict | None = None, sym_hint: str | Non
             return d
     if a in _dec_cache:
         return _dec_cache[a]
-    res = safe_eth_call(addr, SEL_DECIMALS)
-    if is_hex_data(res or "") and res != "0x":
-        try:
-            d = int(abi_decode(["uint8"], bytes.fromhex(res[2:]))[0])
-            _dec_cache[a] = d
-            return d
-        except Exception:
-            pass
+    d = _decimals_from_return(safe_eth_call(addr, SEL_DECIMALS))
+    if d is not None:
+        _dec_cache[a] = d
+        _remember_token(a, decimals=d)
+        return d
     if sym_hint:
         d2 = DECIMALS_BY_SYMBOL.get(sym_hint.upper())
         if isinstance(d2, int):
@@ -334,17 +600,99 @@ def erc20_decimals(addr: str, meta_hint: dict | None = None, sym_hint: str | Non
     _dec_cache[a] = 18
     return 18
 
+def multicall3_aggregate(calls: list[tuple[str, str]]) -> list[str | None] | None:
+    """
+    Run [(target, calldata_hex), ...] through Multicall3.aggregate3 in one eth_call.
+    Returns per-call return data as 0x-hex (None where that call reverted), or None if the
+    multicall itself failed.
+    """
+    if not calls:
+        return []
+    payload = abi_encode(
+        ["(address,bool,bytes)[]"],
+        [[(_checksum_cached(to.lower()), True, bytes.fromhex(data[2:])) for to, data in calls]],
+    )
+    res = safe_eth_call(MULTICALL3_ADDRESS, SEL_AGGREGATE3 + payload.hex())
+    if not is_hex_data(res or "") or res == "0x":
+        return None
+    try:
+        results = _DEC_AGGREGATE3(bytes.fromhex(res[2:]))[0]
+    except Exception:
+        return None
+    if len(results) != len(calls):
+        return None
+    return ["0x" + ret.hex() if ok else None for ok, ret in results]
+
+def prefetch_token_meta(erc20_addrs, nft_addrs, meta_hint: dict | None = None):
+    """
+    Resolve symbol (and decimals for fungibles) of every cold contract in one Multicall3
+    round-trip, filling the caches that erc20_symbol/erc20_decimals read. Anything the
+    multicall could not answer is left for those functions' per-call path.
+    """
+    meta_hint = meta_hint or {}
+    calls: list[tuple[str, str]] = []
+    wants: list[tuple[str, str]] = []  # (addr, "symbol" | "name" | "decimals") per call
+    for a in dict.fromkeys(list(erc20_addrs) + list(nft_addrs)):
+        hint = meta_hint.get(a) or {}
+        if not hint.get("symbol") and a not in _symbol_cache:
+            calls += [(a, SEL_SYMBOL), (a, SEL_NAME)]
+            wants += [(a, "symbol"), (a, "name")]
+    for a in dict.fromkeys(erc20_addrs):
+        hint = meta_hint.get(a) or {}
+        if int(hint.get("decimals") or 0) <= 0 and a not in _dec_cache:
+            calls.append((a, SEL_DECIMALS))
+            wants.append((a, "decimals"))
+    if not calls:
+        return
+
+    results = multicall3_aggregate(calls)
+    if results is None:
+        # No Multicall3 answer: same calls as one plain JSON-RPC batch
+        results = eth_call_direct_batch(calls)
+    if results is None:
+        return
+
+    by_addr: dict[str, dict] = {}
+    for (a, field), res in zip(wants, results):
+        by_addr.setdefault(a, {})[field] = res
+    for a, got in by_addr.items():
+        if "symbol" in got:
+            sym = _symbol_from_return(got["symbol"]) or _symbol_from_return(got.get("name"))
+            _symbol_cache[a] = sym or "UNKNOWN"
+            if sym:
+                _remember_token(a, symbol=sym)
+        if "decimals" in got:
+            d = _decimals_from_return(got["decimals"])
+            if d is not None:
+                _dec_cache[a] = d
+                _remember_token(a, decimals=d)
+
+load_token_cache()
+
 # --------------------------- formatting ---------------------------
+_POW10 = tuple(10 ** i for i in range(80))
+
+def _pow10(n: int) -> int:
+    return _POW10[n] if n < len(_POW10) else 10 ** n
+
 def fmt_amount(value_wei: int, decimals: int, min_dp: int = 2, max_dp: int = 12) -> str:
+    """value_wei / 10**decimals rounded half-even to max_dp places, trailing zeros trimmed to min_dp (pure int math)."""
     if value_wei == 0:
-        return f"{Decimal(0):.{min_dp}f}"
-    q = Decimal(value_wei) / (Decimal(10) ** Decimal(decimals))
-    s = f"{q:.{max_dp}f}"
-    whole, dot, frac = s.partition(".")
-    trimmed = frac.rstrip("0")
+        return "0." + "0" * min_dp if min_dp else "0"
+    sign = "-" if value_wei < 0 else ""
+    v = -value_wei if value_wei < 0 else value_wei
+    if decimals >= max_dp:
+        div = _pow10(decimals - max_dp)
+        q, r = divmod(v, div)
+        if 2 * r > div or (2 * r == div and q & 1):
+            q += 1
+    else:
+        q = v * _pow10(max_dp - decimals)
+    whole, frac = divmod(q, _pow10(max_dp))
+    trimmed = f"{frac:0{max_dp}d}".rstrip("0") if max_dp else ""
     if len(trimmed) < min_dp:
         trimmed = (trimmed + "0" * min_dp)[:min_dp]
-    return whole + (dot + trimmed if trimmed else "")
+    return f"{sign}{whole}" + (("." if max_dp else "") + trimmed if trimmed else "")
 
 def format_token_display_signed(delta_wei: int, decimals: int, symbol: str) -> str:
     sign = "-" if delta_wei < 0 else "+"
@@ -359,15 +707,97 @@ def wei_str_eth(wei: int) -> str:
 
 # --------------------------- classify ---------------------------
 def classify_from_topics(logs: list[dict]) -> str | None:
-    t0s = {(lg.get("topics") or [""])[0] for lg in logs if lg.get("topics")}
-    if any(t in t0s for t in (TOPIC_SWAP_V3, TOPIC_SWAP_V2)):
+    t0s = {lg["topics"][0] for lg in logs if lg.get("topics")}
+    if not _SWAP_TOPICS.isdisjoint(t0s):
         return "swap"
-    if any(t in t0s for t in (TOPIC_MINT_V3, TOPIC_INC_LIQ_V3, TOPIC_MINT_V2)):
+    if not _ADD_LIQ_TOPICS.isdisjoint(t0s):
         return "add_liquidity"
-    if any(t in t0s for t in (TOPIC_BURN_V3, TOPIC_DEC_LIQ_V3, TOPIC_BURN_V2)):
+    if not _REMOVE_LIQ_TOPICS.isdisjoint(t0s):
         return "remove_liquidity"
     return None
 
+# --------------------------- log handlers ---------------------------
+class _LogScan:
+    """Per-receipt accumulator shared by the topic handlers in compute_wallet_deltas."""
+    __slots__ = ("wallet", "wallet_tail", "erc20_eth", "nft_moves", "eth_delta",
+                 "weth_touched", "weth_like", "wallet_ft_contracts")
+
+    def __init__(self, wallet: str, erc20_eth: dict, nft_moves: list):
+        self.wallet = wallet
+        self.wallet_tail = wallet[2:]  # 40 hex chars; cheap substring pre-check on padded topics
+        self.erc20_eth = erc20_eth
+        self.nft_moves = nft_moves
+        self.eth_delta = 0
+        self.weth_touched = False              # wallet in a WETH Deposit/Withdrawal
+        self.weth_like: set[str] = set()       # contracts emitting Deposit/Withdrawal in this receipt
+        self.wallet_ft_contracts: set[str] = set()  # ERC-20s with a Transfer to/from the wallet
+
+def _on_transfer(st: _LogScan, lg: dict, t: list, addr: str):
+    if len(t) < 3 or (st.wallet_tail not in t[1] and st.wallet_tail not in t[2]):
+        return  # malformed, or wallet not a party
+    wallet = st.wallet
+    frm = address_from_topic(t[1])
+    to = address_from_topic(t[2])
+    if len(t) >= 4:
+        token_id = h2i(t[3])
+        if frm == wallet:
+            st.nft_moves.append((addr, token_id, -1))
+        if to == wallet:
+            st.nft_moves.append((addr, token_id, +1))
+        return
+    data_hex = lg.get("data", "0x")
+    if is_hex_data(data_hex) and data_hex != "0x":
+        amt = int(data_hex[2:66], 16)  # first 32-byte word
+        if amt > 0:
+            if frm == wallet:
+                st.erc20_eth[addr] = st.erc20_eth.get(addr, 0) - amt
+                st.wallet_ft_contracts.add(addr)
+            if to == wallet:
+                st.erc20_eth[addr] = st.erc20_eth.get(addr, 0) + amt
+                st.wallet_ft_contracts.add(addr)
+
+def _on_transfer_single(st: _LogScan, lg: dict, t: list, addr: str):
+    if len(t) < 4 or (st.wallet_tail not in t[2] and st.wallet_tail not in t[3]):
+        return  # malformed, or wallet not a party
+    data_hex = (lg.get("data") or "0x")[2:]
+    if len(data_hex) >= 128:
+        token_id = int(data_hex[0:64], 16)
+        qty = int(data_hex[64:128], 16)
+        frm = address_from_topic(t[2])
+        to = address_from_topic(t[3])
+        if qty > 0:
+            if frm == st.wallet:
+                st.nft_moves.append((addr, token_id, -qty))
+            if to == st.wallet:
+                st.nft_moves.append((addr, token_id, +qty))
+
+def _weth_amount(st: _LogScan, lg: dict, t: list, addr: str) -> int:
+    """Amount of a WETH Deposit/Withdrawal by the wallet (0 otherwise); records the contract as WETH-like."""
+    if len(t) < 2:
+        return 0
+    st.weth_like.add(addr)
+    if st.wallet_tail not in t[1] or address_from_topic(t[1]) != st.wallet:
+        return 0
+    amt = h2i(lg.get("data"))
+    if amt > 0:
+        st.weth_touched = True
+    return max(amt, 0)
+
+def _on_weth_withdrawal(st: _LogScan, lg: dict, t: list, addr: str):
+    st.eth_delta += _weth_amount(st, lg, t, addr)
+
+def _on_weth_deposit(st: _LogScan, lg: dict, t: list, addr: str):
+    st.eth_delta -= _weth_amount(st, lg, t, addr)
+
+# topic0 -> handler(scan, log, topics, contract_lower); keys are exactly the balance-relevant topics
+_TOPIC_DISPATCH = {
+    TOPIC_TRANSFER: _on_transfer,
+    TOPIC_TRANSFER_SINGLE: _on_transfer_single,
+    TOPIC_WETH_WITHDRAWAL: _on_weth_withdrawal,
+    TOPIC_WETH_DEPOSIT: _on_weth_deposit,
+}
+assert frozenset(_TOPIC_DISPATCH) == _DELTA_TOPICS
+
 # --------------------------- core delta ---------------------------
 def compute_wallet_deltas(row_tx: dict, rcpt: dict, wallet: str, meta_hint: dict):
     """
@@ -375,10 +805,15 @@ def compute_wallet_deltas(row_tx: dict, rcpt: dict, wallet: str, meta_hint: dict
       erc20_eth: dict[str|'eth' -> int delta] (signed; +recv, -sent)
       nft_moves: list[(contract, tokenId, deltaQty)]
     ETH order: OUTER msg.value -> WETH events -> internals -> trace -> balance delta
+    The internals/trace/balance probes only run when a cheap signal says ETH may have
+    moved for the wallet (it sent the tx, msg.value > 0, or it touched WETH); trace and
+    balance are skipped when the wallet sent the tx and the internals list came back.
     """
     wallet = (wallet or "").lower().strip()
     erc20_eth: dict[str, int] = {}
     nft_moves: list[tuple[str, int, int]] = []
+    sender_is_wallet = bool(wallet) and (row_tx.get("from") or "").lower() == wallet
+    needs_eth_probe = sender_is_wallet
 
     # OUTER tx value (fix)
     eth_log_delta = 0
@@ -387,91 +822,62 @@ def compute_wallet_deltas(row_tx: dict, rcpt: dict, wallet: str, meta_hint: dict
     except Exception:
         outer_val = 0
     if wallet and outer_val > 0:
-        if (row_tx.get("from") or "").lower() == wallet:
+        needs_eth_probe = True
+        if sender_is_wallet:
             eth_log_delta -= outer_val
         if (row_tx.get("to") or "").lower() == wallet:
             eth_log_delta += outer_val
 
-    # Logs: ERC20/721/1155 + WETH
-    for lg in (rcpt.get("logs") or []):
-        t = lg.get("topics") or []
-        if not t:
-            continue
-        t0 = t[0]
-        addr = (lg.get("address") or "").lower()
-
-        if t0 == TOPIC_TRANSFER and len(t) >= 3:
-            frm = address_from_topic(t[1])
-            to = address_from_topic(t[2])
-            if len(t) >= 4:
-                token_id = h2i(t[3])
-                if wallet:
-                    if frm == wallet:
-                        nft_moves.append((addr, token_id, -1))
+    # Logs: ERC20/721/1155 + WETH (nothing to attribute without a wallet).
+    # Irrelevant logs are dropped in one comprehension; the rest go to their topic handler.
+    scan = _LogScan(wallet, erc20_eth, nft_moves)
+    delta_logs = [lg for lg in (rcpt.get("logs") or []) if (lg.get("topics") or ("",))[0] in _TOPIC_DISPATCH] if wallet else []
+    for lg in delta_logs:
+        t = lg["topics"]
+        _TOPIC_DISPATCH[t[0]](scan, lg, t, (lg.get("address") or "").lower())
+
+    eth_log_delta += scan.eth_delta
+    if scan.weth_touched or not scan.weth_like.isdisjoint(scan.wallet_ft_contracts):
+        needs_eth_probe = True
+
+    # Internals (refunds, etc.)
+    internals_ok = False
+    if needs_eth_probe:
+        try:
+            internals = _get({"module": "account", "action": "txlistinternal", "txhash": row_tx["hash"], "page": 1, "offset": 1000, "sort": "asc"})
+            if internals.get("status") == "1":
+                for itx in internals.get("result", []):
+                    frm = (itx.get("from") or "").lower()
+                    to = (itx.get("to") or "").lower()
+                    val = int(itx.get("value") or "0")
+                    if not wallet or val <= 0:
+                        continue
                     if to == wallet:
-                        nft_moves.append((addr, token_id, +1))
-            else:
-                data_hex = lg.get("data", "0x")
-                if is_hex_data(data_hex) and data_hex != "0x":
-                    amt = int(data_hex, 16)
-                    if wallet and amt > 0:
-                        if frm == wallet:
-                            erc20_eth[addr] = erc20_eth.get(addr, 0) - amt
-                        if to == wallet:
-                            erc20_eth[addr] = erc20_eth.get(addr, 0) + amt
-
-        elif t0 == TOPIC_TRANSFER_SINGLE and len(t) >= 4:
-            data_hex = (lg.get("data") or "0x")[2:]
-            if len(data_hex) >= 128:
-                token_id = int(data_hex[0:64], 16)
-                qty = int(data_hex[64:128], 16)
-                frm = address_from_topic(t[2])
-                to = address_from_topic(t[3])
-                if wallet and qty > 0:
+                        eth_log_delta += val
                     if frm == wallet:
-                        nft_moves.append((addr, token_id, -qty))
-                    if to == wallet:
-                        nft_moves.append((addr, token_id, +qty))
-
-        elif t0 == TOPIC_WETH_WITHDRAWAL and len(t) >= 2:
-            who = address_from_topic(t[1])
-            amt = h2i(lg.get("data"))
-            if wallet and who == wallet and amt > 0:
-                eth_log_delta += amt
-        elif t0 == TOPIC_WETH_DEPOSIT and len(t) >= 2:
-            who = address_from_topic(t[1])
-            amt = h2i(lg.get("data"))
-            if wallet and who == wallet and amt > 0:
-                eth_log_delta -= amt
+                        eth_log_delta -= val
+                internals_ok = True
+            elif (internals.get("message") or "").lower().startswith("no transactions"):
+                internals_ok = True
+        except Exception:
+            pass
 
-    # Internals (refunds, etc.)
-    try:
-        internals = _get({"module": "account", "action": "txlistinternal", "txhash": row_tx["hash"], "page": 1, "offset": 1000, "sort": "asc"})
-        if internals.get("status") == "1":
-            for itx in internals.get("result", []):
-                frm = (itx.get("from") or "").lower()
-                to = (itx.get("to") or "").lower()
-                val = int(itx.get("value") or "0")
-                if not wallet or val <= 0:
-                    continue
-                if to == wallet:
-                    eth_log_delta += val
-                if frm == wallet:
-                    eth_log_delta -= val
-    except Exception:
-        pass
+    # Wallet sent the tx and the internals list is complete: outer value + WETH events +
+    # internals already are the whole ETH delta (gas excluded, as in the balance fallback),
+    # so the trace / archival balance probes below would only confirm it.
+    eth_settled = sender_is_wallet and internals_ok
 
     if eth_log_delta != 0:
         erc20_eth["eth"] = erc20_eth.get("eth", 0) + eth_log_delta
 
     # trace fallback
-    if "eth" not in erc20_eth:
+    if needs_eth_probe and not eth_settled and "eth" not in erc20_eth:
         traced = trace_eth_delta(row_tx["hash"], wallet)
         if isinstance(traced, int) and traced != 0:
             erc20_eth["eth"] = traced
 
     # balance-delta fallback
-    if "eth" not in erc20_eth:
+    if needs_eth_probe and not eth_settled and "eth" not in erc20_eth:
         try:
             bn = int(row_tx.get("blockNumber") or "0")
             before_hex = hex_tag(bn - 1 if bn > 0 else 0)
@@ -479,7 +885,7 @@ def compute_wallet_deltas(row_tx: dict, rcpt: dict, wallet: str, meta_hint: dict
             bal_before = h2i(get_balance(wallet, before_hex))
             bal_after = h2i(get_balance(wallet, after_hex))
             eth_delta = bal_after - bal_before
-            if (row_tx.get("from") or "").lower() == wallet:
+            if sender_is_wallet:
                 gas_used = h2i(rcpt.get("gasUsed"))
                 eff_price = h2i(rcpt.get("effectiveGasPrice")) or int(row_tx.get("gasPrice") or "0")
                 gas_cost = gas_used * eff_price if (gas_used and eff_price) else 0
@@ -500,9 +906,8 @@ def build_ft_strings(erc20_eth: dict, meta_hint: dict):
         if key == "eth":
             s = format_token_display_signed(delta, 18, "ETH")
         else:
-            checksum = to_checksum_address(key)
-            sym = erc20_symbol(checksum, meta_hint)
-            dec = erc20_decimals(checksum, meta_hint, sym_hint=sym)
+            sym = erc20_symbol(key, meta_hint)
+            dec = erc20_decimals(key, meta_hint, sym_hint=sym)
             s = format_token_display_signed(delta, dec, sym)
         (sent_items if delta < 0 else recv_items).append(s)
     sent_str = "; ".join(sent_items) if sent_items else ""
@@ -514,12 +919,19 @@ def build_nft_field(nft_moves: list, meta_hint: dict) -> str:
         return ""
     parts = []
     for (contract, token_id, qty) in nft_moves:
-        sym = erc20_symbol(to_checksum_address(contract), meta_hint)
+        sym = erc20_symbol(contract, meta_hint)
         parts.append(format_nft_signed(sym, token_id, qty))
     return "; ".join(parts)
 
+@lru_cache(maxsize=4096)
+def _fmt_ts(ts_unix: int) -> str:
+    """Local time as 'YYYY-MM-DD HH:MM:SS TZ' (same text as strftime with %Z); txs in one block share a second."""
+    dt = datetime.fromtimestamp(ts_unix, tz=AT_TZ)
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d} {dt.tzname()}"
+
 # --------------------------- decode one ---------------------------
-def decode_one_from_row(row: dict, already_known: set, idx_success: int, idx_failed: int):
+def decode_one_from_row(row: dict, already_known: set, idx_success: int, idx_failed: int, rcpt: dict | None = None,
+                        block_ts_map: dict[int, int] | None = None):
     txh = row.get("hash") or row.get("tx_hash")
     if not txh or txh in already_known:
         return None
@@ -528,7 +940,9 @@ def decode_one_from_row(row: dict, already_known: set, idx_success: int, idx_fai
     from_addr = decode_address(row.get("from"))
     to_addr   = decode_address(row.get("to"))
 
-    rcpt = get_tx_receipt(txh)
+    # Prefetched receipt if the batch had it, else one proxy round-trip
+    if not isinstance(rcpt, dict):
+        rcpt = get_tx_receipt(txh)
     if not isinstance(rcpt, dict):
         return None
 
@@ -536,11 +950,15 @@ def decode_one_from_row(row: dict, already_known: set, idx_success: int, idx_fai
     status_hex = str(rcpt.get("status") or "").lower()
     is_failed = (status_hex == "0x0")
 
-    # Timestamp (prefer CSV seconds, fallback via block)
+    # Timestamp (prefer CSV seconds, then the prefetched block map, fallback via block)
     try:
         ts_unix = int(row.get("timeStamp") or "0")
     except Exception:
         ts_unix = 0
+    if ts_unix == 0 and block_ts_map:
+        bn = str(row.get("blockNumber") or "")
+        if bn.isdigit():
+            ts_unix = block_ts_map.get(int(bn), 0)
     if ts_unix == 0:
         block_hash = row.get("blockHash")
         block = get_block_by_hash(block_hash) if block_hash else None
@@ -553,7 +971,7 @@ def decode_one_from_row(row: dict, already_known: set, idx_success: int, idx_fai
                 block2 = get_block_by_number(tag)
                 if isinstance(block2, dict):
                     ts_unix = h2i(block2.get("timestamp"))
-    ts_iso = datetime.fromtimestamp(ts_unix, tz=AT_TZ).strftime("%Y-%m-%d %H:%M:%S %Z") if ts_unix else ""
+    ts_iso = _fmt_ts(ts_unix) if ts_unix else ""
 
     # Gas
     gas_used = h2i(rcpt.get("gasUsed"))
@@ -576,15 +994,24 @@ def decode_one_from_row(row: dict, already_known: set, idx_success: int, idx_fai
             "_failed": True,
         }
 
-    # Success flow
-    meta_hint = fetch_tokentx_metadata(txh)
-    nft_meta = fetch_tokennfttx_metadata(txh)
-    for k, v in nft_meta.items():
-        if k not in meta_hint or (not meta_hint[k].get("symbol") or meta_hint[k]["symbol"] == "UNKNOWN"):
-            meta_hint[k] = v
+    # Success flow; Etherscan token metadata only when a token Transfer log exists (ETH-only txs skip both calls)
+    meta_hint = {}
+    if any((lg.get("topics") or ("",))[0] in _TOKEN_TOPICS for lg in rcpt.get("logs") or []):
+        meta_hint = fetch_tokentx_metadata(txh)
+        nft_meta = fetch_tokennfttx_metadata(txh)
+        for k, v in nft_meta.items():
+            if k not in meta_hint or (not meta_hint[k].get("symbol") or meta_hint[k]["symbol"] == "UNKNOWN"):
+                meta_hint[k] = v
 
     erc20_eth, nft_moves = compute_wallet_deltas(row, rcpt, WALLET_ADDRESS, meta_hint)
 
+    # One multicall for all cold token metadata instead of per-token eth_calls
+    try:
+        prefetch_token_meta([k for k, v in erc20_eth.items() if k != "eth" and v != 0],
+                            [c for c, _, _ in nft_moves], meta_hint)
+    except Exception:
+        pass
+
     logs = rcpt.get("logs", []) or []
     action_type = classify_from_topics(logs)
     if action_type is None:
@@ -618,48 +1045,86 @@ def decode_one_from_row(row: dict, already_known: set, idx_success: int, idx_fai
         "_failed": False,
     }
 
+# --------------------------- output ---------------------------
+def splice_new_rows(new_df, existing_bt) -> bool:
+    """
+    Add new_df (latest first, no hashes already on file) to OUT_CSV_DECODED without
+    re-serializing existing rows. The file is kept latest-first, so rows all older than the
+    oldest existing row are appended, and rows all newer than the newest one are written
+    ahead of a raw byte copy of the existing body. Returns False when the rows interleave
+    (or the file layout differs) and a full rewrite is needed.
+    """
+    with open(OUT_CSV_DECODED, "rb") as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        f.seek(f.tell() - 1)
+        ends_with_newline = f.read(1) == b"\n"
+    if header.decode("utf-8-sig").strip().split(",") != OUT_COLS or not ends_with_newline:
+        return False
+    eol = "\r\n" if header.endswith(b"\r\n") else "\n"
+    body = new_df.to_csv(header=False, index=False, lineterminator=eol).encode("utf-8")
+
+    if new_df["block_time"].max() < existing_bt.min():
+        with open(OUT_CSV_DECODED, "ab") as f:
+            f.write(body)
+        return True
+
+    if new_df["block_time"].min() > existing_bt.max():
+        tmp = OUT_CSV_DECODED.with_name(OUT_CSV_DECODED.name + ".tmp")
+        with open(OUT_CSV_DECODED, "rb") as src, open(tmp, "wb") as out:
+            out.write(src.readline())
+            out.write(body)
+            shutil.copyfileobj(src, out)
+        os.replace(tmp, OUT_CSV_DECODED)
+        return True
+
+    return False
+
 # --------------------------- main ---------------------------
 def main():
+    try:
+        _run()
+    finally:
+        flush_token_cache()
+
+def _run():
     if not os.path.exists(RAW_CSV):
         print(f"ERROR: {RAW_CSV} not found.")
         return
 
-    # Load existing decoded rows (to avoid re-decoding duplicates)
-    already = set()
-    existing: dict[str, dict] = {}
+    # Load existing decoded rows (to avoid re-decoding duplicates); all text, block_time as int
+    existing_df = pd.DataFrame(columns=OUT_COLS)
     if os.path.exists(OUT_CSV_DECODED) and os.stat(OUT_CSV_DECODED).st_size > 0:
-        with open(OUT_CSV_DECODED, "r", newline="", encoding="utf-8") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                txh = row.get("tx_hash")
-                if not txh:
-                    continue
-                try:
-                    row["block_time"] = int(row.get("block_time") or 0)
-                except Exception:
-                    row["block_time"] = 0
-                existing[txh] = row
-                already.add(txh)
+        existing_df = pd.read_csv(OUT_CSV_DECODED, dtype=str, keep_default_na=False)
+        existing_df = existing_df[existing_df["tx_hash"] != ""]
+    already = set(existing_df["tx_hash"])
 
-    log_info(f"Loaded {len(existing)} previously decoded rows.")
+    log_info(f"Loaded {len(existing_df)} previously decoded rows.")
 
     # Read input raw txs
-    with open(RAW_CSV, "r", newline="", encoding="utf-8") as f:
-        rows = list(csv.DictReader(f))
-    log_info(f"Loaded {len(rows)} raw rows; {len(already)} already decoded.")
+    raw_df = pd.read_csv(RAW_CSV, dtype=str, keep_default_na=False)
+    log_info(f"Loaded {len(raw_df)} raw rows; {len(already)} already decoded.")
 
-    # Build pending list to know total count for progress bar
-    pending = []
-    for row in rows:
-        txh = row.get("hash") or row.get("tx_hash")
-        if txh and txh not in already:
-            pending.append(row)
+    # Build pending list to know total count for progress bar (unique tx hashes only)
+    hash_col = "hash" if "hash" in raw_df.columns else "tx_hash"
+    if hash_col in raw_df.columns:
+        mask = (raw_df[hash_col] != "") & ~raw_df[hash_col].isin(already)
+        pending = raw_df[mask].drop_duplicates(hash_col).to_dict("records")
+    else:
+        pending = []
 
     total = len(pending)
     if total == 0:
         log_info("Nothing new to decode.")
         return
 
+    # Rows without a CSV timestamp: one batched block lookup per distinct block instead of one per tx
+    ts_blocks = sorted({int(r["blockNumber"]) for r in pending
+                        if not str(r.get("timeStamp") or "").strip("0") and str(r.get("blockNumber") or "").isdigit()})
+    block_ts_map: dict[int, int] = {}
+    for i in range(0, len(ts_blocks), RECEIPT_BATCH_SIZE):
+        block_ts_map.update(get_block_timestamps_batch(ts_blocks[i:i + RECEIPT_BATCH_SIZE]))
+
     log_info(f"Decoding {total} transaction(s)...")
     print_progress(0, total)  # initial bar
 
@@ -667,61 +1132,70 @@ def main():
     new_rows: list[dict] = []
     succ_cnt = fail_cnt = 0
 
-    for i, row in enumerate(pending, 1):
-        txh = row.get("hash") or row.get("tx_hash")
-        try:
-            decoded = decode_one_from_row(row, already, len(new_rows) + 1, len(new_rows) + 1)
-            if decoded:
-                already.add(txh)
-                if decoded.pop("_failed", False):
-                    fail_cnt += 1
-                else:
-                    succ_cnt += 1
-                new_rows.append(decoded)
-        except Exception as e:
-            log_info(f"[err] {txh}: {e}")
-            time.sleep(0.3)
-
-        # Update progress bar after each tx
-        print_progress(i, total)
-
-    # Merge existing + new
-    merged = dict(existing)
-    for r in new_rows:
-        merged[r["tx_hash"]] = r
-
-    # To list & sort (latest first)
-    out_rows = list(merged.values())
-    for r in out_rows:
-        try:
-            r["block_time"] = int(r.get("block_time") if r.get("block_time") not in (None, "") else 0)
-        except Exception:
-            r["block_time"] = 0
-    out_rows.sort(key=lambda r: (r["block_time"], r.get("tx_hash") or ""), reverse=True)
+    done = 0
+    chunks = [pending[i:i + RECEIPT_BATCH_SIZE] for i in range(0, total, RECEIPT_BATCH_SIZE)]
 
-    # Write single CSV
-    cols = ["tx_hash", "tx_timestamp", "block_time", "type",
-            "from_address", "to_address",
-            "amount_sent", "amount_received", "total_gas_eth", "nft_transfere"]
+    def chunk_hashes(c):
+        return [row.get("hash") or row.get("tx_hash") for row in c]
 
-    with open(OUT_CSV_DECODED, "w", newline="", encoding="utf-8") as f_out:
-        w = csv.DictWriter(f_out, fieldnames=cols)
-        w.writeheader()
-        for r in out_rows:
-            w.writerow({
-                "tx_hash": r.get("tx_hash", ""),
-                "tx_timestamp": r.get("tx_timestamp", ""),
-                "block_time": int(r.get("block_time") or 0),
-                "type": r.get("type", "unknown"),
-                "from_address": r.get("from_address", ""),
-                "to_address": r.get("to_address", ""),
-                "amount_sent": r.get("amount_sent", ""),
-                "amount_received": r.get("amount_received", ""),
-                "total_gas_eth": r.get("total_gas_eth", fmt_amount(0, 18, 5, 8)),
-                "nft_transfere": r.get("nft_transfere", ""),
-            })
-
-    log_info(f"Finished. New: {succ_cnt} success, {fail_cnt} failed. Total written: {len(out_rows)} rows.")
+    with ThreadPoolExecutor(max_workers=DECODE_WORKERS) as pool, ThreadPoolExecutor(max_workers=1) as prefetch:
+        # Receipts for the next chunk are fetched while the current chunk decodes
+        next_receipts = prefetch.submit(get_tx_receipts_batch, chunk_hashes(chunks[0]))
+        for k, chunk in enumerate(chunks):
+            start = k * RECEIPT_BATCH_SIZE
+            try:
+                receipts = next_receipts.result()
+            except Exception:
+                receipts = {}
+            if k + 1 < len(chunks):
+                next_receipts = prefetch.submit(get_tx_receipts_batch, chunk_hashes(chunks[k + 1]))
+
+            futures = {}
+            for j, row in enumerate(chunk, start + 1):
+                txh = row.get("hash") or row.get("tx_hash")
+                fut = pool.submit(decode_one_from_row, row, already, j, j, receipts.get(txh), block_ts_map)
+                futures[fut] = txh
+
+            for fut in as_completed(futures):
+                txh = futures[fut]
+                try:
+                    decoded = fut.result()
+                    if decoded:
+                        already.add(txh)
+                        if decoded.pop("_failed", False):
+                            fail_cnt += 1
+                        else:
+                            succ_cnt += 1
+                        new_rows.append(decoded)
+                except Exception as e:
+                    log_info(f"[err] {txh}: {e}")
+
+                # Update progress bar after each tx
+                done += 1
+                print_progress(done, total)
+
+    # Normalize new rows, latest first
+    defaults = {c: "" for c in OUT_COLS}
+    defaults.update({"type": "unknown", "total_gas_eth": fmt_amount(0, 18, 5, 8)})
+    new_df = pd.DataFrame(new_rows, columns=OUT_COLS).fillna(defaults)
+    new_df["block_time"] = pd.to_numeric(new_df["block_time"], errors="coerce").fillna(0).astype("int64")
+    new_df = new_df.sort_values(["block_time", "tx_hash"], ascending=[False, False])
+
+    existing_bt = pd.to_numeric(existing_df["block_time"], errors="coerce").fillna(0).astype("int64")
+    if new_df.empty:
+        written = len(existing_df)
+    elif not existing_df.empty and splice_new_rows(new_df, existing_bt):
+        written = len(existing_df) + len(new_df)
+    else:
+        # Full rewrite: merge existing + new (new wins on tx_hash), sort latest first
+        existing_df = existing_df.reindex(columns=OUT_COLS).fillna(defaults)
+        existing_df["block_time"] = existing_bt
+        merged = pd.concat([new_df, existing_df], ignore_index=True).drop_duplicates("tx_hash", keep="first")
+        merged = merged.sort_values(["block_time", "tx_hash"], ascending=[False, False])
+        merged.to_csv(OUT_CSV_DECODED, index=False, encoding="utf-8", lineterminator="\r\n")
+        written = len(merged)
+
+    log_info(f"Finished. New: {succ_cnt} success, {fail_cnt} failed. Total written: {written} rows.")
     log_info(f"Output: {OUT_CSV_DECODED}")
 
 # --------------------------- run ---------------------------
@@ -729,4 +1203,4 @@ if __name__ == "__main__":
     main()
 
 # A01_decode_txs.py — Linea (CHAIN_ID=59144)
-# Software Version 1.0
\ No newline at end of file
+# Software Version 1.24
\ No newline at end of file
@@ -1,38 +1,64 @@
 # A02_onchain_price_WETH_BTC.py
-# Software Version 1.0
+# Software Version 1.24
 # Reads from C:\TrueBlocks\database\data_decode_txs.csv
 # Writes to C:\TrueBlocks\database\data_price_weth_wbtc.csv
 # - Only processes rows not already present in the output (by tx_hash)
 # - Live CLI progress bar (no extra blank line before Finished)
 # - Saves CSV sorted from latest to oldest by tx_timestamp
+#   New rows are spliced in without re-serializing existing ones when they don't interleave
+#   (--compact forces a full rewrite).
+# - Caches block lookups and pool state in C:\TrueBlocks\database\.block_cache\linea_blocks.sqlite
 # - Output columns exactly:
 #   tx_hash,tx_timestamp,block_time,type,from_address,to_address,amount_sent,amount_received,total_gas_eth,nft_transfere,weth_per_wbtc,wbtc_per_weth
 
 from web3 import Web3
 from web3.middleware import ExtraDataToPOAMiddleware
-from decimal import Decimal, getcontext
+from eth_abi import decode as abi_decode, encode as abi_encode
 import os
-from typing import Tuple, Dict, Any, Optional, List, Union, Set
-import csv
+from typing import NamedTuple, Tuple, Dict, Any, Optional, List, Union, Set, Iterable
 from datetime import datetime, timezone
 from dateutil import tz, parser as dtparser
 from dateutil.parser._parser import UnknownTimezoneWarning
 from pathlib import Path
 import time
 import argparse
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-# --------------------------------- Precision ---------------------------------
-getcontext().prec = 60
+import itertools
+import json
+import random
+import shutil
+import sys
+import sqlite3
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import pandas as pd
+try:
+    import msgspec  # Optional (faster JSON-RPC encode/decode)
+except Exception:
+    msgspec = None  # type: ignore
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
 
 # ---------------------------------- Paths ------------------------------------
 INPUT_CSV  = Path(r"C:\TrueBlocks\database\data_decode_txs.csv")
 OUTPUT_CSV = Path(r"C:\TrueBlocks\database\data_price_weth_wbtc.csv")
 OUTPUT_TMP = OUTPUT_CSV.with_suffix(".csv.tmp")
+# Block headers, minute->block answers and pool state survive between runs (all immutable history)
+CACHE_DB = OUTPUT_CSV.parent / ".block_cache" / "linea_blocks.sqlite"
+# Blocks this close to the head are not written to CACHE_DB (shallow reorgs). CACHE_DB is
+# shared with A03, so keep this equal to A03's FINALITY_MARGIN.
+FINALITY_MARGIN = 32
 
 # ------------------------------- Chain / Pool --------------------------------
 LINEA_RPC_URL = os.environ.get("LINEA_RPC_URL", "https://rpc.linea.build")  # chainId 59144
+# Batches are spread over these endpoints (weighted by measured latency); one that fails or
+# rate-limits is skipped for RPC_COOLDOWN_S.
+LINEA_RPC_POOL = [u.strip() for u in os.environ.get(
+    "LINEA_RPC_POOL", f"{LINEA_RPC_URL},https://linea.drpc.org,https://1rpc.io/linea").split(",") if u.strip()]
+RPC_COOLDOWN_S = 30
+RPC_BATCH_SIZE = 20  # JSON-RPC requests per HTTP POST
+# Batches in flight at once. The work is network-bound, so this is sized for the RPC endpoint,
+# not for the local CPU count (raise PRICE_WORKERS if the endpoint tolerates more).
+PRICE_WORKERS = int(os.environ.get("PRICE_WORKERS", "8"))
 POOL_ADDRESS = Web3.to_checksum_address("0xc0cd56e070e25913d631876218609f2191da1c2a")
 
 # -------------------------------- Timezone -----------------------------------
@@ -44,165 +70,430 @@ TZINFOS = {
     "GMT": tz.UTC,
 }
 
-# --------------------------------- Minimal ABIs ------------------------------
-POOL_V3_META_ABI = [
-    {"inputs":[],"name":"token0","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},
-    {"inputs":[],"name":"token1","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},
-]
-POOL_V2_ABI = [
-    {"inputs":[],"name":"getReserves","outputs":[
-        {"internalType":"uint112","name":"reserve0","type":"uint112"},
-        {"internalType":"uint112","name":"reserve1","type":"uint112"},
-        {"internalType":"uint32","name":"blockTimestampLast","type":"uint32"}
-    ],"stateMutability":"view","type":"function"},
-    {"inputs":[],"name":"token0","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},
-    {"inputs":[],"name":"token1","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},
-]
-ERC20_ABI = [
-    {"inputs":[],"name":"decimals","outputs":[{"internalType":"uint8","name":"","type":"uint8"}],"stateMutability":"view","type":"function"},
-    {"inputs":[],"name":"symbol","outputs":[{"internalType":"string","name":"","type":"string"}],"stateMutability":"view","type":"function"},
-]
-
-Q96 = Decimal(2) ** 96
+Q192 = 1 << 192  # (2**96)**2: sqrtPriceX96**2 / Q192 = token1 per token0 (raw units)
+RATIO_DP = 18
+_RATIO_SCALE = 10 ** RATIO_DP
+
+Ratio = Tuple[int, int]  # exact price as (numerator, denominator)
+
+SEL_SLOT0 = "0x3850c7bd"        # slot0()
+SEL_GET_RESERVES = "0x0902f1ac"  # getReserves()
+SEL_TOKEN0 = "0x0dfe1681"        # token0()
+SEL_TOKEN1 = "0xd21220a7"        # token1()
+SEL_DECIMALS = "0x313ce567"      # decimals()
+SEL_SYMBOL = "0x95d89b41"        # symbol()
+SEL_AGGREGATE3 = "0x82ad56cb"    # aggregate3((address,bool,bytes)[])
+MULTICALL3 = Web3.to_checksum_address("0xcA11bde05977b3631167028862bE2a173976CA11")  # same address on Linea
+
+# ------------------------------- HTTP session --------------------------------
+# One pooled keep-alive session (sized for PRICE_WORKERS threads) shared by web3 and the raw
+# batches, so every request after the first reuses a warm TLS connection. Transient 429/5xx are
+# retried by urllib3 (POST included: every JSON-RPC call here is a read).
+_session = requests.Session()
+_session.headers["Content-Type"] = "application/json"
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=max(16, 2 * PRICE_WORKERS),
+    max_retries=Retry(
+        total=4,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    ),
+)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
 
 # ------------------------------- Web3 helpers --------------------------------
 def connect() -> Web3:
-    w3 = Web3(Web3.HTTPProvider(LINEA_RPC_URL, request_kwargs={"timeout": 30}))
+    w3 = Web3(Web3.HTTPProvider(LINEA_RPC_URL, request_kwargs={"timeout": 30}, session=_session))
     w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
     if not w3.is_connected():
         raise RuntimeError("Could not connect to Linea RPC")
     return w3
 
-def token_meta(w3: Web3, token_addr: str) -> Tuple[int, str]:
-    t = w3.eth.contract(address=token_addr, abi=ERC20_ABI)
-    decimals = t.functions.decimals().call()
-    symbol = t.functions.symbol().call()
-    return int(decimals), symbol
-
-def price_from_sqrtPriceX96(sqrtPriceX96: int) -> Decimal:
-    sp = Decimal(sqrtPriceX96)
-    return (sp * sp) / (Q96 * Q96)
-
-def read_v3_sqrtPriceX96_raw(w3: Web3, addr: Union[str, bytes], block_tag: Union[int, str]) -> int:
-    if isinstance(addr, str):
-        to_addr = Web3.to_checksum_address(addr)
+# ----------------------------- Raw JSON-RPC batch -----------------------------
+_rpc_ids = itertools.count(1)
+
+if msgspec is not None:
+    class RPCResp(msgspec.Struct):
+        id: Any = None
+        result: Any = None
+        error: Any = None
+
+    _rpc_encode = msgspec.json.Encoder().encode
+    _rpc_decode_batch = msgspec.json.Decoder(List[RPCResp]).decode
+
+    def _decode_batch(content: bytes) -> Dict[Any, Any]:
+        """id -> result (None where the node returned an error)."""
+        return {item.id: (None if item.error is not None else item.result) for item in _rpc_decode_batch(content)}
+else:
+    def _rpc_encode(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def _decode_batch(content: bytes) -> Dict[Any, Any]:
+        body = json.loads(content)
+        if not isinstance(body, list):
+            raise RuntimeError(f"RPC batch rejected: {body}")
+        return {item.get("id"): (None if "error" in item else item.get("result"))
+                for item in body if isinstance(item, dict)}
+
+_rpc_down_until: Dict[str, float] = {}
+_rpc_weight: Dict[str, float] = {u: 1.0 for u in LINEA_RPC_POOL}
+
+def _mark_rpc(url: str, ok: bool):
+    if ok:
+        _rpc_down_until.pop(url, None)
     else:
-        to_addr = addr
-    selector = Web3.keccak(text="slot0()")[:4]  # 0x3850c7bd
-    data = selector
-    result = w3.eth.call({"to": to_addr, "data": data}, block_identifier=block_tag)
-    if result is None or len(result) < 32:
+        _rpc_down_until[url] = time.monotonic() + RPC_COOLDOWN_S
+
+def _probe_endpoint(url: str):
+    t0 = time.perf_counter()
+    try:
+        r = _session.post(url, data=_rpc_encode({"jsonrpc": "2.0", "id": 0, "method": "eth_blockNumber", "params": []}),
+                          timeout=10)
+        r.raise_for_status()
+        _rpc_weight[url] = 1.0 / max(time.perf_counter() - t0, 0.001)
+    except Exception:
+        _mark_rpc(url, False)
+
+def probe_endpoints():
+    """Time one eth_blockNumber per pool endpoint (in parallel); weight = 1/latency, failures start cold."""
+    if len(LINEA_RPC_POOL) < 2:
+        return
+    with ThreadPoolExecutor(max_workers=len(LINEA_RPC_POOL)) as ex:
+        list(ex.map(_probe_endpoint, LINEA_RPC_POOL))
+
+def rpc_endpoints() -> List[str]:
+    """Failover order for one request: a latency-weighted pick, the other healthy ones, then cold ones."""
+    now = time.monotonic()
+    healthy = [u for u in LINEA_RPC_POOL if _rpc_down_until.get(u, 0.0) <= now]
+    cold = [u for u in LINEA_RPC_POOL if u not in healthy]
+    if len(healthy) > 1:
+        first = random.choices(healthy, weights=[_rpc_weight[u] for u in healthy])[0]
+        healthy.remove(first)
+        healthy.insert(0, first)
+    return healthy + cold
+
+def rpc_batch(calls: List[Tuple[str, list]]) -> List[Any]:
+    """
+    Send [(method, params), ...] as JSON-RPC batch arrays, RPC_BATCH_SIZE per POST.
+    Returns results in call order; entries the node answered with an error are None.
+    Raises if no endpoint accepted a POST.
+    """
+    out: List[Any] = []
+    for i in range(0, len(calls), RPC_BATCH_SIZE):
+        chunk = calls[i:i + RPC_BATCH_SIZE]
+        ids = [next(_rpc_ids) for _ in chunk]
+        payload = _rpc_encode([{"jsonrpc": "2.0", "id": k, "method": m, "params": p} for k, (m, p) in zip(ids, chunk)])
+        by_id = None
+        last_err: Optional[Exception] = None
+        for url in rpc_endpoints():
+            try:
+                r = _session.post(url, data=payload, timeout=30)
+                r.raise_for_status()
+                by_id = _decode_batch(r.content)
+            except Exception as e:
+                _mark_rpc(url, False)
+                last_err = e
+                continue
+            _mark_rpc(url, True)
+            break
+        if by_id is None:
+            raise RuntimeError(f"All RPC endpoints failed: {last_err}")
+        out.extend(by_id.get(k) for k in ids)
+    return out
+
+def rpc_call(method: str, params: list) -> Any:
+    res = rpc_batch([(method, params)])[0]
+    if res is None:
+        raise RuntimeError(f"{method} failed")
+    return res
+
+def _block_param(block_tag: Union[int, str]) -> str:
+    return hex(block_tag) if isinstance(block_tag, int) else block_tag
+
+def multicall3(calls: List[Tuple[str, str]], block_tag: Union[int, str] = "latest") -> List[Optional[bytes]]:
+    """
+    [(target, calldata_hex), ...] as one Multicall3.aggregate3 eth_call (failures allowed).
+    Returns each call's raw return bytes, None where that call reverted or returned nothing.
+    """
+    payload = abi_encode(["(address,bool,bytes)[]"], [[(to, True, bytes.fromhex(data[2:])) for to, data in calls]])
+    res = rpc_call("eth_call", [{"to": MULTICALL3, "data": SEL_AGGREGATE3 + payload.hex()}, _block_param(block_tag)])
+    results = abi_decode(["(bool,bytes)[]"], bytes.fromhex(res[2:]))[0]
+    return [data if ok and data else None for ok, data in results]
+
+def format_ratio(r: Ratio) -> str:
+    """num/den with RATIO_DP decimals, rounded half-even (same text as f"{Decimal:.18f}")."""
+    num, den = r
+    q, rem = divmod(num * _RATIO_SCALE, den)
+    if 2 * rem > den or (2 * rem == den and q & 1):
+        q += 1
+    return f"{q // _RATIO_SCALE}.{q % _RATIO_SCALE:0{RATIO_DP}d}"
+
+def _sqrt_from_slot0(result: Optional[str]) -> int:
+    if not result or len(result) < 66:
         raise RuntimeError("slot0() returned no data")
-    sqrt = int.from_bytes(result[0:32], byteorder="big")
+    sqrt = int(result[2:66], 16)
     if sqrt == 0:
         raise RuntimeError("slot0() sqrtPriceX96 is zero")
     return sqrt
 
+# (pool_type, block_number) -> raw slot0()/getReserves() return data; historical state never changes
+# Filled from worker threads without a lock: single dict operations are atomic, first writer wins.
+_pool_state_cache: Dict[Tuple[str, int], str] = {}
+
+def read_pool_state_batch(pool_type: str, block_tags: List[int]) -> List[Optional[str]]:
+    """Raw slot0()/getReserves() return data at each block, batched; None where the call failed."""
+    data = SEL_SLOT0 if pool_type == "v3" else SEL_GET_RESERVES
+    miss = [b for b in dict.fromkeys(block_tags) if (pool_type, b) not in _pool_state_cache]
+    if miss:
+        res = rpc_batch([("eth_call", [{"to": POOL_ADDRESS, "data": data}, _block_param(b)]) for b in miss])
+        for b, r in zip(miss, res):
+            if r and r != "0x":
+                _pool_state_cache.setdefault((pool_type, b), r)
+    return [_pool_state_cache.get((pool_type, b)) for b in block_tags]
+
+def _word_address(data: bytes) -> str:
+    """ABI address return: the low 20 bytes of the first word."""
+    return Web3.to_checksum_address("0x" + data[12:32].hex())
+
+def _word_string(data: bytes) -> str:
+    """ABI string return with the canonical (offset, length, chars) layout; bytes32 symbols too."""
+    if len(data) == 32:
+        return data.rstrip(b"\x00").decode("utf-8", "replace")
+    off = int.from_bytes(data[0:32], "big")
+    n = int.from_bytes(data[off:off + 32], "big")
+    return data[off + 32:off + 32 + n].decode("utf-8", "replace")
+
 def detect_pool_type_and_meta(w3: Web3, addr: str):
-    try:
-        _ = read_v3_sqrtPriceX96_raw(w3, addr, "latest")
-        pool_v3 = w3.eth.contract(address=addr, abi=POOL_V3_META_ABI)
-        t0 = pool_v3.functions.token0().call()
-        t1 = pool_v3.functions.token1().call()
-        d0, s0 = token_meta(w3, t0)
-        d1, s1 = token_meta(w3, t1)
-        return "v3", {"t0": t0, "t1": t1, "d0": d0, "s0": s0, "d1": d1, "s1": s1}
-    except Exception:
-        pool_v2 = w3.eth.contract(address=addr, abi=POOL_V2_ABI)
-        r0, r1, _ = pool_v2.functions.getReserves().call()
-        t0 = pool_v2.functions.token0().call()
-        t1 = pool_v2.functions.token1().call()
-        d0, s0 = token_meta(w3, t0)
-        d1, s1 = token_meta(w3, t1)
-        return "v2", {"t0": t0, "t1": t1, "d0": d0, "s0": s0, "d1": d1, "s1": s1}
+    """
+    Pool type and token metadata in two Multicall3 round-trips: (slot0, getReserves, token0,
+    token1) on the pool, then (decimals, symbol) on both tokens.
+    """
+    slot0, reserves, r_t0, r_t1 = multicall3([
+        (addr, SEL_SLOT0), (addr, SEL_GET_RESERVES), (addr, SEL_TOKEN0), (addr, SEL_TOKEN1),
+    ])
+    if slot0 and int.from_bytes(slot0[0:32], "big") != 0:
+        pool_type = "v3"
+    elif reserves and len(reserves) >= 96:
+        pool_type = "v2"
+    else:
+        raise RuntimeError("Pool answers neither slot0() nor getReserves()")
+    if not r_t0 or not r_t1:
+        raise RuntimeError("token0()/token1() returned no data")
+    t0, t1 = _word_address(r_t0), _word_address(r_t1)
+
+    r_d0, r_s0, r_d1, r_s1 = multicall3([(t0, SEL_DECIMALS), (t0, SEL_SYMBOL), (t1, SEL_DECIMALS), (t1, SEL_SYMBOL)])
+    if not all((r_d0, r_s0, r_d1, r_s1)):
+        raise RuntimeError("decimals()/symbol() returned no data")
+    d0, d1 = r_d0[31], r_d1[31]  # uint8: last byte of the word
+    s0, s1 = _word_string(r_s0), _word_string(r_s1)
+    return pool_type, {"t0": t0, "t1": t1, "d0": d0, "s0": s0, "d1": d1, "s1": s1}
 
 # ----------------------- Faster block finding with cache ----------------------
 class BlockFinder:
     def __init__(self, w3: Web3):
         self.w3 = w3
         self._cache_by_minute: Dict[int, int] = {}
+        self._ts_by_block: Dict[int, int] = {}  # every header probed this run
         self._latest_num = None
         self._latest_ts = None
-        self.rpc_calls = 0
-        self._lock = threading.Lock()
-
-    def _get_block(self, num: int):
-        b = self.w3.eth.get_block(num)
-        with self._lock:
-            self.rpc_calls += 1
-        return b
+        self._seeded = 0  # headers loaded from CACHE_DB rather than fetched
+
+    def _get_blocks_ts(self, nums: List[int]) -> List[int]:
+        """Timestamps of the given blocks; cache misses go out in one batched POST (header only)."""
+        miss = [n for n in dict.fromkeys(nums) if n not in self._ts_by_block]
+        if miss:
+            res = rpc_batch([("eth_getBlockByNumber", [hex(n), False]) for n in miss])
+            if any(not isinstance(b, dict) for b in res):
+                raise RuntimeError("eth_getBlockByNumber failed")
+            for n, b in zip(miss, res):
+                self._ts_by_block.setdefault(n, int(b["timestamp"], 16))  # first writer wins, no lock needed
+        return [self._ts_by_block[n] for n in nums]
+
+    @property
+    def rpc_calls(self) -> int:
+        """Block headers fetched from the node so far (derived from the cache, so no shared counter)."""
+        return len(self._ts_by_block) - self._seeded
+
+    def _get_block_ts(self, num: int) -> int:
+        return self._get_blocks_ts([num])[0]
 
     def _ensure_latest(self):
         if self._latest_num is None:
-            self._latest_num = self.w3.eth.block_number
-            latest = self._get_block(self._latest_num)
-            self._latest_ts = int(latest.timestamp)
-
-    def _binary_search(self, target_ts: int) -> int:
-        self._ensure_latest()
+            self._latest_num = int(rpc_call("eth_blockNumber", []), 16)
+            self._latest_ts = self._get_block_ts(self._latest_num)
+
+    def _locate(self, target_ts: int, lo: int, lo_ts: int) -> int:
+        """
+        Last block with timestamp <= target_ts, given ts(lo) <= target_ts.
+        The first probes interpolate inside [lo, latest] from the observed block time (usually
+        one round-trip on Linea's steady ~2s blocks); after that it falls back to bisection.
+        """
         if self._latest_ts <= target_ts:
             return int(self._latest_num)
-        low = 1
-        high = self._latest_num
-        while low <= high:
-            mid = (low + high) // 2
-            b = self._get_block(mid)
-            ts = int(b.timestamp)
-            if ts > target_ts:
-                high = mid - 1
+        hi, hi_ts = self._latest_num, self._latest_ts  # invariant: ts(lo) <= target < ts(hi)
+        step = 0
+        while hi - lo > 1:
+            if step < 3:
+                guess = lo + (target_ts - lo_ts) * (hi - lo) // max(hi_ts - lo_ts, 1)
+            else:
+                guess = (lo + hi) // 2
+            guess = min(max(guess, lo + 1), hi - 1)
+            # guess and its successor share one round-trip
+            g_ts, n_ts = self._get_blocks_ts([guess, guess + 1])
+            if g_ts <= target_ts < n_ts:
+                return guess
+            if g_ts > target_ts:
+                hi, hi_ts = guess, g_ts
             else:
-                nb = self._get_block(min(mid + 1, self._latest_num))
-                nts = int(nb.timestamp)
-                if nts > target_ts:
-                    return int(mid)
-                low = mid + 1
-        return max(1, high)
-
-    def find_before(self, target_ts: int, hint_block: Optional[int] = None, local_step_limit: int = 64) -> int:
-        key = (target_ts // 60) * 60
-        hit = self._cache_by_minute.get(key)
-        if hit:
-            return hit
-
-        if hint_block:
-            cur = max(1, hint_block)
-            step = 0
-            b = self._get_block(cur)
-            while step < local_step_limit and int(b.timestamp) <= target_ts and cur < self.w3.eth.block_number:
-                cur += 1
-                b = self._get_block(cur)
-                step += 1
-            if int(b.timestamp) > target_ts:
-                ans = max(1, cur - 1)
-                self._cache_by_minute[key] = ans
-                return ans
-
-        ans = self._binary_search(target_ts)
-        self._cache_by_minute[key] = ans
+                lo, lo_ts = guess + 1, n_ts
+            step += 1
+        return lo
+
+    def sweep(self, sorted_ts: Iterable[int]):
+        """
+        Yield find_before(ts) for ascending timestamps (None where the lookup failed).
+        Each search starts at the previous answer, so a sorted batch costs about one probe
+        per distinct minute instead of a full binary search per row.
+        """
+        self._ensure_latest()
+        lo = lo_ts = None
+        for target_ts in sorted_ts:
+            key = (target_ts // 60) * 60
+            hit = self._cache_by_minute.get(key)
+            # a minute answer from an earlier run is only reused if that block is not after target_ts
+            if hit and self._ts_by_block.get(hit, target_ts) <= target_ts:
+                yield hit
+                continue
+            try:
+                if lo is None or lo_ts > target_ts:
+                    lo, lo_ts = 1, self._get_block_ts(1)
+                ans = 1 if target_ts < lo_ts else self._locate(target_ts, lo, lo_ts)
+                self._cache_by_minute.setdefault(key, ans)
+                lo, lo_ts = ans, self._get_block_ts(ans)
+                yield ans
+            except Exception:
+                yield None
+
+    def find_before(self, target_ts: int) -> int:
+        ans = next(self.sweep([target_ts]))
+        if ans is None:
+            raise RuntimeError(f"Could not resolve block for ts={target_ts}")
         return ans
 
+# ----------------------------- Persistent cache -------------------------------
+def _cache_db() -> sqlite3.Connection:
+    CACHE_DB.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(CACHE_DB)
+    con.executescript(
+        "CREATE TABLE IF NOT EXISTS block_ts (block INTEGER PRIMARY KEY, ts INTEGER NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS minute_block (minute INTEGER PRIMARY KEY, block INTEGER NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS pool_state (pool TEXT NOT NULL, kind TEXT NOT NULL, block INTEGER NOT NULL,"
+        " data TEXT NOT NULL, PRIMARY KEY (pool, kind, block));"
+    )
+    return con
+
+_persisted: Dict[str, Set[Any]] = {"block_ts": set(), "minute_block": set(), "pool_state": set()}
+
+def load_cache(bf: "BlockFinder"):
+    """Seed bf's header/minute maps and _pool_state_cache from CACHE_DB (missing or unreadable -> cold start)."""
+    if not CACHE_DB.exists():
+        return
+    pool = POOL_ADDRESS.lower()
+    try:
+        con = _cache_db()
+        try:
+            bf._ts_by_block.update(con.execute("SELECT block, ts FROM block_ts"))
+            bf._cache_by_minute.update(con.execute("SELECT minute, block FROM minute_block"))
+            for kind, block, data in con.execute("SELECT kind, block, data FROM pool_state WHERE pool = ?", (pool,)):
+                _pool_state_cache[(kind, block)] = data
+        finally:
+            con.close()
+    except Exception:
+        return
+    _persisted["block_ts"] = set(bf._ts_by_block)
+    bf._seeded = len(bf._ts_by_block)
+    _persisted["minute_block"] = set(bf._cache_by_minute)
+    _persisted["pool_state"] = set(_pool_state_cache)
+
+def flush_cache(bf: "BlockFinder"):
+    """Write final entries (FINALITY_MARGIN below the head) added since load_cache to CACHE_DB in one transaction."""
+    if bf._latest_num is None:
+        # Every block came from CACHE_DB; new pool states still need the head to judge finality
+        if all(k in _persisted["pool_state"] for k in list(_pool_state_cache)):
+            return
+        try:
+            bf._ensure_latest()
+        except Exception:
+            return
+    final = bf._latest_num - FINALITY_MARGIN
+    pool = POOL_ADDRESS.lower()
+    # list(d.items()) snapshots in one step, so a late writer cannot break the iteration
+    blocks = [(b, t) for b, t in list(bf._ts_by_block.items())
+              if b <= final and b not in _persisted["block_ts"]]
+    minutes = [(m, b) for m, b in list(bf._cache_by_minute.items())
+               if b <= final and m not in _persisted["minute_block"]]
+    states = [(pool, k, b, d) for (k, b), d in list(_pool_state_cache.items())
+              if isinstance(b, int) and b <= final and (k, b) not in _persisted["pool_state"]]
+    if not (blocks or minutes or states):
+        return
+    try:
+        con = _cache_db()
+        try:
+            with con:
+                con.executemany("INSERT OR IGNORE INTO block_ts (block, ts) VALUES (?, ?)", blocks)
+                con.executemany("INSERT OR REPLACE INTO minute_block (minute, block) VALUES (?, ?)", minutes)
+                con.executemany("INSERT OR IGNORE INTO pool_state (pool, kind, block, data) VALUES (?, ?, ?, ?)", states)
+        finally:
+            con.close()
+    except Exception:
+        return
+    _persisted["block_ts"].update(b for b, _ in blocks)
+    _persisted["minute_block"].update(m for m, _ in minutes)
+    _persisted["pool_state"].update((k, b) for _, k, b, _ in states)
+
 # ---------------------------------- Ratios -----------------------------------
-def get_ratios_at_block(w3: Web3, pool_type: str, meta: Dict[str, Any], block_tag: int) -> Dict[str, Any]:
-    if pool_type == "v3":
-        sqrtPriceX96 = read_v3_sqrtPriceX96_raw(w3, POOL_ADDRESS, block_tag)
-        price1_per_0_raw = price_from_sqrtPriceX96(sqrtPriceX96)
-        adj = Decimal(10) ** Decimal(meta["d0"] - meta["d1"])
-        eth_per_wbtc = price1_per_0_raw * adj            # ETH per WBTC
-        wbtc_per_eth = Decimal(1) / eth_per_wbtc         # WBTC per ETH
+class PoolConst(NamedTuple):
+    """Per-pool constants, fixed once the tokens are known (see pool_constants)."""
+    adj_num: int  # 10**(d0-d1) as num/den: raw token1-per-token0 -> human units
+    adj_den: int
+    weth_is_token0: bool
+
+def _is_eth(sym: str) -> bool:
+    return "ETH" in sym.upper()
+
+def _is_wbtc(sym: str) -> bool:
+    return "WBTC" in sym.upper()
+
+def pool_constants(meta: Dict[str, Any]) -> PoolConst:
+    if _is_eth(meta["s0"]) and _is_wbtc(meta["s1"]):
+        weth_is_token0 = True
+    elif _is_wbtc(meta["s0"]) and _is_eth(meta["s1"]):
+        weth_is_token0 = False
     else:
-        pool = w3.eth.contract(address=POOL_ADDRESS, abi=POOL_V2_ABI)
-        r0, r1, _ = pool.functions.getReserves().call(block_identifier=block_tag)
-        r0 = Decimal(r0)
-        r1 = Decimal(r1)
-        eth_per_wbtc = (r1 / r0) * (Decimal(10) ** Decimal(meta["d0"] - meta["d1"]))
-        wbtc_per_eth = Decimal(1) / eth_per_wbtc
+        raise RuntimeError(f"Pool is not ETH/WBTC: {meta['s0']}/{meta['s1']}")
+    d0, d1 = meta["d0"], meta["d1"]
+    return PoolConst(10 ** max(d0 - d1, 0), 10 ** max(d1 - d0, 0), weth_is_token0)
 
-    return {
-        "ratios": {
-            f"{meta['s0']}/{meta['s1']}": wbtc_per_eth,  # WBTC/ETH
-            f"{meta['s1']}/{meta['s0']}": eth_per_wbtc,  # ETH/WBTC
-        }
-    }
+def ratios_from_pool_state(pool_type: str, pc: PoolConst, state: Optional[str]) -> Tuple[Ratio, Ratio]:
+    """(weth_per_wbtc, wbtc_per_weth) from raw slot0()/getReserves() return data (see read_pool_state_batch)."""
+    if pool_type == "v3":
+        sqrtPriceX96 = _sqrt_from_slot0(state)
+        num, den = sqrtPriceX96 * sqrtPriceX96, Q192  # token1 per token0, raw units
+    else:
+        if not state or len(state) < 130:
+            raise RuntimeError("getReserves() returned no data")
+        r0 = int(state[2:66], 16)
+        r1 = int(state[66:130], 16)
+        if r0 == 0 or r1 == 0:
+            raise RuntimeError("getReserves() returned an empty reserve")
+        num, den = r1, r0
+    p = (num * pc.adj_num, den * pc.adj_den)  # token1 per token0, human units
+    inv = (p[1], p[0])
+    return (inv, p) if pc.weth_is_token0 else (p, inv)
 
 # -------------------------------- CSV workflow -------------------------------
 INPUT_FIELDS = [
@@ -239,87 +530,129 @@ def parse_tx_time_to_utc(s: str) -> Optional[datetime]:
     except Exception:
         return None
 
-def parse_tx_time_for_sort(s: str) -> int:
-    dt = parse_tx_time_to_utc(s)
-    return int(dt.timestamp()) if dt else 0
-
-def read_input_rows(path: Path) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
-    if not path.exists():
-        return rows
-    with path.open(newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            clean = {k: (r.get(k, "") or "") for k in INPUT_FIELDS}
-            rows.append(clean)
-    return rows
-
-def read_existing_output(path: Path) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
-    if not path.exists():
-        return rows
-    with path.open(newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            clean = {k: (r.get(k, "") or "") for k in OUTPUT_FIELDS}
-            rows.append(clean)
-    return rows
-
-def existing_hashes(existing_rows: List[Dict[str, Any]]) -> Set[str]:
-    return {(r.get("tx_hash") or "").lower() for r in existing_rows if r.get("tx_hash")}
+def read_csv_fields(path: Path, fields: List[str]) -> pd.DataFrame:
+    """CSV as all-text columns (C parser), restricted to `fields`; missing columns/cells become ""."""
+    if not path.exists() or path.stat().st_size == 0:
+        return pd.DataFrame(columns=fields)
+    df = pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8",
+                     usecols=lambda c: c in fields)
+    return df.reindex(columns=fields).fillna("")
+
+def existing_hashes(df: pd.DataFrame) -> pd.Series:
+    """Lowercased non-empty tx_hash values (for Series.isin)."""
+    h = df["tx_hash"].str.lower()
+    return h[h != ""]
+
+# A01 writes "YYYY-MM-DD HH:MM:SS CET|CEST"; the abbreviation pins the UTC offset
+_TX_TIME_RE = r"^\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\s*([A-Za-z]+)\s*$"
+_TZ_ABBREV_OFFSET_S = {"CEST": 7200, "CET": 3600, "UTC": 0, "GMT": 0}
+
+def tx_times_to_unix(values: Iterable[str]) -> List[Optional[int]]:
+    """
+    Vectorized parse_tx_time_to_utc -> unix seconds (None where unparseable).
+    Strings in the A01 format are parsed in one pandas pass; anything else goes through dateutil.
+    """
+    s = pd.Series(list(values), dtype=object).fillna("").astype(str)
+    if s.empty:
+        return []
+    parts = s.str.extract(_TX_TIME_RE)
+    wall = pd.to_datetime(parts[0], format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    wall_s = (wall - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    offset = parts[1].map(_TZ_ABBREV_OFFSET_S)
+    unix = (wall_s - offset).tolist()
+    out: List[Optional[int]] = []
+    for raw, ts in zip(s.tolist(), unix):
+        if ts == ts:  # not NaN
+            out.append(int(ts))
+        else:
+            dt = parse_tx_time_to_utc(raw)
+            out.append(int(dt.timestamp()) if dt else None)
+    return out
+
+def unix_ts_column(df: pd.DataFrame) -> pd.Series:
+    """
+    row_to_unix_ts for a whole frame: block_time where it is an integer, else the parsed
+    tx_timestamp (<NA> if neither resolves). Rows written by A01 carry block_time, so the
+    string parser only runs for the odd row without it.
+    """
+    bt = df["block_time"]
+    is_int = bt.str.isdecimal().fillna(False).astype(bool)  # clean digits: no strip/regex pass
+    if not is_int.all():
+        bt = bt.str.strip()
+        is_int = bt.str.fullmatch(r"[+-]?\d+").fillna(False).astype(bool)
+    out = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    out[is_int] = bt[is_int].astype("int64")
+    rest = ~is_int
+    if rest.any():
+        out[rest] = pd.array(tx_times_to_unix(df.loc[rest, "tx_timestamp"]), dtype="Int64")
+    return out
+
+def sort_latest_first(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows latest -> oldest by their unix time (unresolvable last); ties keep their current order."""
+    keys = unix_ts_column(df).fillna(0).astype("int64")
+    return df.loc[keys.sort_values(ascending=False, kind="stable").index]
 
 def row_to_unix_ts(row: Dict[str, Any]) -> int:
-    bt = (row.get("block_time") or "").strip()
-    if bt:
+    bt = row.get("block_time") or ""
+    if bt and bt[0].isdigit():
         try:
             return int(bt)
-        except Exception:
+        except ValueError:
             pass
     dt_utc = parse_tx_time_to_utc(row.get("tx_timestamp", ""))
     if dt_utc is None:
         raise ValueError("Cannot resolve timestamp for row")
     return int(dt_utc.timestamp())
 
-def write_all_atomic(path: Path, temp_path: Path, rows: List[Dict[str, Any]]):
+def write_all_atomic(path: Path, temp_path: Path, df: pd.DataFrame):
+    """Whole table to temp_path, then rename over path (same bytes csv.DictWriter produced)."""
     path.parent.mkdir(parents=True, exist_ok=True)
-    with temp_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
-        writer.writeheader()
-        writer.writerows(rows)
+    df.to_csv(temp_path, columns=OUTPUT_FIELDS, index=False, encoding="utf-8", lineterminator="\r\n")
     temp_path.replace(path)
 
+def splice_new_rows(path: Path, temp_path: Path, new_df: pd.DataFrame, existing_keys: pd.Series) -> bool:
+    """
+    Add new_df (latest first) to the latest-first file at path without re-serializing the
+    existing rows: rows no newer than the oldest existing row are appended, rows all newer
+    than the newest one are written ahead of a raw byte copy of the existing body.
+    Returns False when the rows interleave (or the file layout differs); then rewrite instead.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        f.seek(f.tell() - 1)
+        ends_with_newline = f.read(1) == b"\n"
+    if header.decode("utf-8-sig").strip().split(",") != OUTPUT_FIELDS or not ends_with_newline:
+        return False
+    eol = "\r\n" if header.endswith(b"\r\n") else "\n"
+    new_keys = unix_ts_column(new_df).fillna(0)
+    body = new_df.to_csv(columns=OUTPUT_FIELDS, header=False, index=False, lineterminator=eol).encode("utf-8")
+
+    if new_keys.max() <= existing_keys.min():
+        with open(path, "ab") as f:
+            f.write(body)
+        return True
+
+    if new_keys.min() > existing_keys.max():
+        with open(path, "rb") as src, open(temp_path, "wb") as out:
+            out.write(src.readline())
+            out.write(body)
+            shutil.copyfileobj(src, out)
+        temp_path.replace(path)
+        return True
+
+    return False
+
 # ------------------------------ Processing core ------------------------------
-def extract_eth_wbtc_ratios(ratios: Dict[str, Decimal]) -> Tuple[Decimal, Decimal]:
-    weth_per_wbtc = None
-    wbtc_per_weth = None
-    for pair, val in ratios.items():
-        up = pair.upper()
-        if (("ETH" in up or "WETH" in up) and "WBTC" in up):
-            left, right = up.split("/")
-            if ("ETH" in left or "WETH" in left) and "WBTC" in right:
-                weth_per_wbtc = val
-            if "WBTC" in left and ("ETH" in right or "WETH" in right):
-                wbtc_per_weth = val
-    if weth_per_wbtc is None and wbtc_per_weth is not None:
-        weth_per_wbtc = Decimal(1) / wbtc_per_weth
-    if wbtc_per_weth is None and weth_per_wbtc is not None:
-        wbtc_per_weth = Decimal(1) / weth_per_wbtc
-    if weth_per_wbtc is None or wbtc_per_weth is None:
-        raise RuntimeError(f"Could not extract ETH/WBTC ratios from keys: {list(ratios.keys())}")
-    return weth_per_wbtc, wbtc_per_weth
-
-def process_row(w3: Web3, pool_type: str, meta: Dict[str, Any], bf: BlockFinder, row: Dict[str, Any], hint_block: Optional[int]):
-    unix_ts = row_to_unix_ts(row)
-    block_tag = bf.find_before(unix_ts, hint_block=hint_block)
-    hist = get_ratios_at_block(w3, pool_type, meta, block_tag)
-    weth_per_wbtc, wbtc_per_weth = extract_eth_wbtc_ratios(hist["ratios"])
+def process_row(pool_type: str, pc: PoolConst, row: Dict[str, Any], block_tag: int, state: Optional[str]):
+    unix_ts = row["_unix_ts"]
+    weth_per_wbtc, wbtc_per_weth = ratios_from_pool_state(pool_type, pc, state)
 
     out_row = {k: row.get(k, "") for k in INPUT_FIELDS}
-    out_row["weth_per_wbtc"] = f"{weth_per_wbtc:.18f}"
-    out_row["wbtc_per_weth"] = f"{wbtc_per_weth:.18f}"
+    out_row["weth_per_wbtc"] = format_ratio(weth_per_wbtc)
+    out_row["wbtc_per_weth"] = format_ratio(wbtc_per_weth)
     out_row["_block_tag"] = block_tag
     out_row["_unix_ts"] = unix_ts
-    out_row["_sort_ts"] = parse_tx_time_for_sort(out_row.get("tx_timestamp", ""))
     return out_row
 
 # ------------------------------ CLI look & feel ------------------------------
@@ -335,143 +668,178 @@ def _progress_line(done: int, total: int) -> str:
     bar = "█" * filled + " " * (_BAR_WIDTH - filled)
     return f"[PROGRESS {pct:>3}%] |{bar}|"
 
+_PROGRESS_INTERVAL_S = 0.1
+_last_draw = {"t": 0.0, "line": ""}
+
 def print_progress(done: int, total: int):
+    """Redraw at most every _PROGRESS_INTERVAL_S (always the first and final step), and only on change."""
+    now = time.monotonic()
+    if 0 < done < total and now - _last_draw["t"] < _PROGRESS_INTERVAL_S:
+        return
     line = _progress_line(done, total)
-    print("\r" + line, end="", flush=True)
+    if line == _last_draw["line"]:
+        return
+    _last_draw["t"] = now
+    _last_draw["line"] = line
+    sys.stdout.write("\r" + line)
+    sys.stdout.flush()
 
 def finish_progress():
     print("\r" + _progress_line(100, 100), flush=True)
 
 # --------------------------------- Runner ------------------------------------
-def run_incremental(workers: int = 4) -> Dict[str, Any]:
-    # Load input + existing output
-    raw_rows = read_input_rows(INPUT_CSV)
-    existing_rows = read_existing_output(OUTPUT_CSV)
-    done_hashes = existing_hashes(existing_rows)
-
-    already = 0
-    todo_rows: List[Dict[str, Any]] = []
-    seen_this_batch: Set[str] = set()
-    for r in raw_rows:
-        h = (r.get("tx_hash") or "").lower()
-        if not h:
-            continue
-        if h in done_hashes:
-            already += 1
-            continue
-        if h in seen_this_batch:
-            continue
-        seen_this_batch.add(h)
-        todo_rows.append(r)
+def run_incremental(workers: int = PRICE_WORKERS, compact: bool = False) -> Dict[str, Any]:
+    # Load input + existing output (all text columns)
+    raw_df = read_csv_fields(INPUT_CSV, INPUT_FIELDS)
+    existing_df = read_csv_fields(OUTPUT_CSV, OUTPUT_FIELDS)
+    done_hashes = existing_hashes(existing_df)
+
+    # New work: non-empty hash, not in the output yet, first occurrence only
+    h = raw_df["tx_hash"].str.lower()
+    is_done = h.isin(done_hashes)
+    already = int(is_done.sum())
+    todo_df = raw_df[(h != "") & ~is_done & ~h.duplicated()]
 
     print_info("")
-    print_info(f"Loaded {len(raw_rows)} raw rows; {already} already fetched")
-    print_info(f"Fetching price for {len(todo_rows)} transaction(s)...")
+    print_info(f"Loaded {len(raw_df)} raw rows; {already} already fetched")
+    print_info(f"Fetching price for {len(todo_df)} transaction(s)...")
 
-    total_to_do = len(todo_rows)
+    total_to_do = len(todo_df)
 
     if total_to_do == 0:
-        # Sort existing rows latest->oldest by tx_timestamp for consistency
-        for r in existing_rows:
-            r["_sort_ts"] = parse_tx_time_for_sort(r.get("tx_timestamp", ""))
-        existing_rows.sort(key=lambda r: r["_sort_ts"], reverse=True)
-        for r in existing_rows:
-            r.pop("_sort_ts", None)
+        # Sort existing rows latest->oldest by tx_timestamp for consistency (no-op if already sorted)
+        existing_keys = unix_ts_column(existing_df).fillna(0)
         finish_progress()
-        write_all_atomic(OUTPUT_CSV, OUTPUT_TMP, existing_rows)
-        print_info(f"Finished. New: 0 success, 0 failed. Total written: {len(existing_rows)} rows.")
+        if compact or not OUTPUT_CSV.exists() or not existing_keys.is_monotonic_decreasing:
+            write_all_atomic(OUTPUT_CSV, OUTPUT_TMP, sort_latest_first(existing_df))
+        print_info(f"Finished. New: 0 success, 0 failed. Total written: {len(existing_df)} rows.")
         print_info(f"Output: {str(OUTPUT_CSV).lower()}")
         return {
             "new_success": 0,
             "new_failed": 0,
-            "total_written": len(existing_rows)
+            "total_written": len(existing_df)
         }
 
     # Prepare chain
     w3 = connect()
+    probe_endpoints()
     pool_type, meta = detect_pool_type_and_meta(w3, POOL_ADDRESS)
+    pc = pool_constants(meta)
     bf = BlockFinder(w3)
+    load_cache(bf)
 
-    # Resolve timestamps early for better caching
-    resolved = []
-    for r in todo_rows:
-        try:
-            ts = row_to_unix_ts(r)
-            r["_unix_ts"] = ts
-            r["_sort_ts"] = parse_tx_time_for_sort(r.get("tx_timestamp", ""))
-            resolved.append(r)
-        except Exception:
-            # skip rows we can't timestamp
-            pass
-    resolved.sort(key=lambda x: x["_unix_ts"])
+    # Resolve timestamps early for better caching; rows we can't timestamp are skipped
+    todo_df = todo_df.assign(_unix_ts=unix_ts_column(todo_df)).dropna(subset=["_unix_ts"])
+    todo_df["_unix_ts"] = todo_df["_unix_ts"].astype("int64")
+    resolved = todo_df.sort_values("_unix_ts", kind="stable").to_dict("records")
     total_to_do = len(resolved)
 
     produced = 0
     failed = 0
     out_rows: List[Dict[str, Any]] = []
-    hint_for_chunk = None
-
-    # initial progress line (0%)
-    print_progress(0, total_to_do)
 
-    start = time.time()
-    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
-        futures = [ex.submit(process_row, w3, pool_type, meta, bf, r, hint_for_chunk) for r in resolved]
-        for fut in as_completed(futures):
+    # Progress covers both stages: one step per block lookup, one per price batch
+    # (batch count is an upper-bound estimate until the sweep is done)
+    n_batches = -(-total_to_do // RPC_BATCH_SIZE)
+    total_steps = total_to_do + n_batches
+    steps = 0
+    print_progress(0, total_steps)
+
+    # Pool-state batches in flight while the sweep keeps going; bounded so the sweep can't
+    # run arbitrarily far ahead of the price fetches
+    max_inflight = 2 * max(1, workers)
+
+    def drain(futs, return_when):
+        nonlocal produced, failed, steps
+        done, pending = wait(futs, return_when=return_when)
+        for fut in done:
+            batch = futs.pop(fut)
             try:
-                out_row = fut.result()
-                out_rows.append(out_row)
-                produced += 1
-                hint_for_chunk = out_row["_block_tag"]
+                states = fut.result()
             except Exception:
-                failed += 1
-            # update progress on every completion
-            print_progress(produced + failed, total_to_do)
-
-    # Clean internals for new rows
-    for r in out_rows:
-        r.pop("_unix_ts", None)
-        r.pop("_block_tag", None)
-
-    # Merge: existing + new (avoid duplicates)
-    merged_rows = list(existing_rows)
-    existing_set = existing_hashes(existing_rows)
-    for r in out_rows:
-        if (r.get("tx_hash") or "").lower() not in existing_set:
-            merged_rows.append({k: r.get(k, "") for k in OUTPUT_FIELDS})
-
-    # Sort latest -> oldest by tx_timestamp
-    for r in merged_rows:
-        r["_sort_ts"] = parse_tx_time_for_sort(r.get("tx_timestamp", ""))
-    merged_rows.sort(key=lambda r: r["_sort_ts"], reverse=True)
-    for r in merged_rows:
-        r.pop("_sort_ts", None)
-
-    # Write atomically
-    write_all_atomic(OUTPUT_CSV, OUTPUT_TMP, merged_rows)
+                states = [None] * len(batch)
+            for (block_tag, rows), state in zip(batch.items(), states):
+                for r in rows:
+                    try:
+                        out_rows.append(process_row(pool_type, pc, r, block_tag, state))
+                        produced += 1
+                    except Exception:
+                        failed += 1
+            steps += 1
+            print_progress(steps, total_steps)
+
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            # Stage 1 (timestamp -> block, one forward sweep over the ascending timestamps) feeds
+            # stage 2 (pool state once per distinct block, RPC_BATCH_SIZE eth_calls per POST) as
+            # soon as a batch of distinct blocks is complete. Blocks come out non-decreasing, so
+            # rows of one block are adjacent; a block showing up again hits the pool-state cache.
+            state_futs: Dict[Any, Dict[int, List[Dict[str, Any]]]] = {}
+            rows_by_block: Dict[int, List[Dict[str, Any]]] = {}
+
+            def submit():
+                nonlocal rows_by_block
+                if len(state_futs) >= max_inflight:
+                    drain(state_futs, FIRST_COMPLETED)
+                state_futs[ex.submit(read_pool_state_batch, pool_type, list(rows_by_block))] = rows_by_block
+                rows_by_block = {}
+
+            for r, block_tag in zip(resolved, bf.sweep(r["_unix_ts"] for r in resolved)):
+                if block_tag is None:
+                    failed += 1
+                else:
+                    if block_tag not in rows_by_block and len(rows_by_block) == RPC_BATCH_SIZE:
+                        submit()
+                    rows_by_block.setdefault(block_tag, []).append(r)
+                steps += 1
+                print_progress(steps, total_steps)
+            if rows_by_block:
+                submit()
+
+            drain(state_futs, ALL_COMPLETED)
+            total_steps = steps
+            print_progress(steps, total_steps)
+    finally:
+        flush_cache(bf)  # keep whatever was fetched, even if the run was interrupted
+
+    # Merge: existing + new (avoid duplicates); selecting OUTPUT_FIELDS drops the internals
+    new_df = pd.DataFrame(out_rows, columns=OUTPUT_FIELDS)
+    new_df = sort_latest_first(new_df[~new_df["tx_hash"].str.lower().isin(done_hashes)])
+    total_written = len(existing_df) + len(new_df)
+
+    existing_keys = unix_ts_column(existing_df).fillna(0)
+    if new_df.empty and not compact and existing_keys.is_monotonic_decreasing:
+        pass  # nothing to add, file already in order
+    elif (new_df.empty or existing_df.empty or compact or not existing_keys.is_monotonic_decreasing
+          or not splice_new_rows(OUTPUT_CSV, OUTPUT_TMP, new_df, existing_keys)):
+        # Full rewrite: existing + new, latest -> oldest by tx_timestamp, atomically
+        merged = sort_latest_first(pd.concat([existing_df, new_df], ignore_index=True))
+        write_all_atomic(OUTPUT_CSV, OUTPUT_TMP, merged)
 
     # Final console (no extra blank line)
     finish_progress()
     elapsed = time.time() - start
-    print_info(f"Finished. New: {produced - failed} success, {failed} failed. Total written: {len(merged_rows)} rows.")
+    print_info(f"Finished. New: {produced - failed} success, {failed} failed. Total written: {total_written} rows.")
     print_info(f"Output: {str(OUTPUT_CSV).lower()}")
 
     return {
         "new_success": produced - failed,
         "new_failed": failed,
-        "total_written": len(merged_rows),
+        "total_written": total_written,
         "elapsed_sec": round(elapsed, 2),
     }
 
 # ---------------------------------- Main -------------------------------------
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--workers", type=int, default=min(4, (os.cpu_count() or 4)))
+    parser.add_argument("--workers", type=int, default=PRICE_WORKERS)
+    parser.add_argument("--compact", action="store_true", help="rewrite the whole output instead of splicing")
     args = parser.parse_args()
-    run_incremental(workers=args.workers)
+    run_incremental(workers=args.workers, compact=args.compact)
 
 if __name__ == "__main__":
     main()
 
 # A02_onchain_price_WETH_BTC.py
-# Software Version 1.0
\ No newline at end of file
+# Software Version 1.24
\ No newline at end of file
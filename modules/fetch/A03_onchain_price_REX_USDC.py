@@ -1,5 +1,5 @@
 # A02_onchain_price_REX_USDC.py
-# Software Version 1.4 (increase with changes by +0.1, also for AI made changes)
+# Software Version 3.2 (increase with changes by +0.1, also for AI made changes)
 # Reads from C:\TrueBlocks\database\data_decode_txs.csv
 # Writes to C:\TrueBlocks\database\data_price_rex_usdc.csv
 #
@@ -14,32 +14,46 @@
 # - Connects to Linea (chainId 59144) via LINEA_RPC_URL or defaults to public RPC.
 # - Detects if pool is Uniswap V3-like (slot0) or V2-like (getReserves) and computes price accordingly.
 # - Computes REX/USDC and USDC/REX regardless of token order in the pool.
+# - Block headers and minute->block answers persist in .block_cache/linea_blocks.sqlite next to
+#   the output (shared with A02); delete that file to force a cold start.
+# - Pool type and token metadata are remembered there too; later runs only re-check the pool shape
+#   with one eth_call.
 
 from web3 import Web3
 from web3.middleware import ExtraDataToPOAMiddleware
-from decimal import Decimal, getcontext
+from eth_abi import decode as abi_decode
 import os
 from typing import Tuple, Dict, Any, Optional, List, Union, Set, Iterable
-import csv
 from datetime import datetime, timezone
 from dateutil import tz, parser as dtparser
 from dateutil.parser._parser import UnknownTimezoneWarning
 from pathlib import Path
+import sys
 import time
 import argparse
+import sqlite3
+import json
 import threading
+import itertools
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import pandas as pd
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# --------------------------------- Precision ---------------------------------
-getcontext().prec = 60
-
 # ---------------------------------- Paths ------------------------------------
 INPUT_CSV  = Path(r"C:\TrueBlocks\database\data_decode_txs.csv")
 OUTPUT_CSV = Path(r"C:\TrueBlocks\database\data_price_rex_usdc.csv")
 OUTPUT_TMP = OUTPUT_CSV.with_suffix(".csv.tmp")
+CACHE_DB   = OUTPUT_CSV.parent / ".block_cache" / "linea_blocks.sqlite"  # chain-wide, shared with A02
 
 # ------------------------------- Chain / Pool --------------------------------
 LINEA_RPC_URL = os.environ.get("LINEA_RPC_URL", "https://rpc.linea.build")  # chainId 59144
+RPC_BATCH_SIZE = 20  # JSON-RPC requests per HTTP POST
+# Price reads in flight at once. The work is network-bound, so this is sized for the RPC endpoint,
+# not for the local CPU count (raise PRICE_WORKERS if the endpoint tolerates more).
+PRICE_WORKERS = int(os.environ.get("PRICE_WORKERS", "8"))
+FINALITY_MARGIN = 32 # blocks this close to the head are not written to CACHE_DB
 # Target pool provided by user
 POOL_ADDRESS = Web3.to_checksum_address("0xCf4f2471872d07191990055C6329e12774522003")
 
@@ -52,166 +66,353 @@ TZINFOS = {
     "GMT": tz.UTC,
 }
 
-# --------------------------------- Minimal ABIs ------------------------------
-POOL_V3_META_ABI = [
-    {"inputs":[],"name":"token0","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},
-    {"inputs":[],"name":"token1","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},
-]
-POOL_V2_ABI = [
-    {"inputs":[],"name":"getReserves","outputs":[
-        {"internalType":"uint112","name":"reserve0","type":"uint112"},
-        {"internalType":"uint112","name":"reserve1","type":"uint112"},
-        {"internalType":"uint32","name":"blockTimestampLast","type":"uint32"}
-    ],"stateMutability":"view","type":"function"},
-    {"inputs":[],"name":"token0","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},
-    {"inputs":[],"name":"token1","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},
-]
-ERC20_ABI = [
-    {"inputs":[],"name":"decimals","outputs":[{"internalType":"uint8","name":"","type":"uint8"}],"stateMutability":"view","type":"function"},
-    {"inputs":[],"name":"symbol","outputs":[{"internalType":"string","name":"","type":"string"}],"stateMutability":"view","type":"function"},
-]
-
-Q96 = Decimal(2) ** 96
+Q192 = 1 << 192  # (2**96)**2: sqrtPriceX96**2 / Q192 = token1 per token0 (raw units)
+RATIO_DP = 18
+_RATIO_SCALE = 10 ** RATIO_DP
+
+Ratio = Tuple[int, int]  # exact price as (numerator, denominator)
+
+SEL_SLOT0 = "0x3850c7bd"         # slot0()
+SEL_GET_RESERVES = "0x0902f1ac"  # getReserves()
+SEL_TOKEN0 = "0x0dfe1681"        # token0()
+SEL_TOKEN1 = "0xd21220a7"        # token1()
+SEL_DECIMALS = "0x313ce567"      # decimals()
+SEL_SYMBOL = "0x95d89b41"        # symbol()
+
+# ------------------------------- HTTP session --------------------------------
+# One pooled keep-alive session (sized for PRICE_WORKERS threads) shared by web3 and the raw
+# batches, so every request after the first reuses a warm TLS connection. Transient 429/5xx are
+# retried by urllib3 (POST included: every JSON-RPC call here is a read).
+_session = requests.Session()
+_session.headers["Content-Type"] = "application/json"
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=max(16, 2 * PRICE_WORKERS),
+    max_retries=Retry(
+        total=4,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    ),
+)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
 
 # ------------------------------- Web3 helpers --------------------------------
 def connect() -> Web3:
-    w3 = Web3(Web3.HTTPProvider(LINEA_RPC_URL, request_kwargs={"timeout": 30}))
+    w3 = Web3(Web3.HTTPProvider(LINEA_RPC_URL, request_kwargs={"timeout": 30}, session=_session))
     w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
     if not w3.is_connected():
         raise RuntimeError("Could not connect to Linea RPC")
     return w3
 
-def token_meta(w3: Web3, token_addr: str) -> Tuple[int, str]:
-    t = w3.eth.contract(address=token_addr, abi=ERC20_ABI)
-    decimals = t.functions.decimals().call()
-    symbol = t.functions.symbol().call()
-    return int(decimals), symbol
+# ----------------------------- Raw JSON-RPC batch -----------------------------
+_rpc_ids = itertools.count(1)
 
-def price_from_sqrtPriceX96(sqrtPriceX96: int) -> Decimal:
-    sp = Decimal(sqrtPriceX96)
-    return (sp * sp) / (Q96 * Q96)
+def rpc_batch(calls: List[Tuple[str, list]]) -> List[Any]:
+    """
+    Send [(method, params), ...] as JSON-RPC batch arrays, RPC_BATCH_SIZE per POST.
+    Returns results in call order; entries the node answered with an error are None.
+    Raises if a POST itself fails.
+    """
+    out: List[Any] = []
+    for i in range(0, len(calls), RPC_BATCH_SIZE):
+        chunk = calls[i:i + RPC_BATCH_SIZE]
+        ids = [next(_rpc_ids) for _ in chunk]
+        payload = [{"jsonrpc": "2.0", "id": k, "method": m, "params": p} for k, (m, p) in zip(ids, chunk)]
+        r = _session.post(LINEA_RPC_URL, json=payload, timeout=30)
+        r.raise_for_status()
+        body = r.json()
+        if not isinstance(body, list):
+            raise RuntimeError(f"RPC batch rejected: {body}")
+        by_id = {item.get("id"): item for item in body if isinstance(item, dict)}
+        for k in ids:
+            item = by_id.get(k) or {"error": "missing"}
+            out.append(None if "error" in item else item.get("result"))
+    return out
 
-def read_v3_sqrtPriceX96_raw(w3: Web3, addr: Union[str, bytes], block_tag: Union[int, str]) -> int:
-    if isinstance(addr, str):
-        to_addr = Web3.to_checksum_address(addr)
-    else:
-        to_addr = addr
-    selector = Web3.keccak(text="slot0()")[:4]  # 0x3850c7bd
-    data = selector
-    result = w3.eth.call({"to": to_addr, "data": data}, block_identifier=block_tag)
-    if result is None or len(result) < 32:
+def rpc_call(method: str, params: list) -> Any:
+    res = rpc_batch([(method, params)])[0]
+    if res is None:
+        raise RuntimeError(f"{method} failed")
+    return res
+
+def _eth_call(to: str, data: str, block_tag: Union[int, str] = "latest") -> Tuple[str, list]:
+    return "eth_call", [{"to": to, "data": data}, hex(block_tag) if isinstance(block_tag, int) else block_tag]
+
+def _result_bytes(res: Optional[str]) -> bytes:
+    return bytes.fromhex(res[2:]) if res and len(res) > 2 else b""
+
+def price_from_sqrtPriceX96(sqrtPriceX96: int) -> Ratio:
+    return sqrtPriceX96 * sqrtPriceX96, Q192
+
+def _scale_decimals(r: Ratio, d0: int, d1: int) -> Ratio:
+    """Raw token1-per-token0 -> human units (multiply by 10**(d0-d1)), staying exact."""
+    num, den = r
+    if d0 >= d1:
+        return num * 10 ** (d0 - d1), den
+    return num, den * 10 ** (d1 - d0)
+
+def _inv(r: Ratio) -> Ratio:
+    return r[1], r[0]
+
+def format_ratio(r: Ratio) -> str:
+    """num/den with RATIO_DP decimals, rounded half-even (same text as f"{Decimal:.18f}")."""
+    num, den = r
+    q, rem = divmod(num * _RATIO_SCALE, den)
+    if 2 * rem > den or (2 * rem == den and q & 1):
+        q += 1
+    return f"{q // _RATIO_SCALE}.{q % _RATIO_SCALE:0{RATIO_DP}d}"
+
+def read_v3_sqrtPriceX96_raw(addr: str, block_tag: Union[int, str]) -> int:
+    result = _result_bytes(rpc_call(*_eth_call(addr, SEL_SLOT0, block_tag)))
+    if len(result) < 32:
         raise RuntimeError("slot0() returned no data")
     sqrt = int.from_bytes(result[0:32], byteorder="big")
     if sqrt == 0:
         raise RuntimeError("slot0() sqrtPriceX96 is zero")
     return sqrt
 
+def read_v2_reserves_raw(addr: str, block_tag: Union[int, str]) -> Tuple[int, int]:
+    result = _result_bytes(rpc_call(*_eth_call(addr, SEL_GET_RESERVES, block_tag)))
+    if len(result) < 96:
+        raise RuntimeError("getReserves() returned no data")
+    r0, r1, _ = abi_decode(["uint112", "uint112", "uint32"], result)
+    return r0, r1
+
 def detect_pool_type_and_meta(w3: Web3, addr: str):
     """
-    Try v3 first by calling slot0(); if it fails, assume v2-compatible.
+    v3 if slot0() answers with a non-zero price, else v2-compatible if getReserves() answers.
     Returns ("v3" or "v2", meta) where meta has t0,t1,d0,s0,d1,s1.
+    Two batched POSTs: (slot0, getReserves, token0, token1) on the pool, then
+    (decimals, symbol) on both tokens.
     """
-    try:
-        _ = read_v3_sqrtPriceX96_raw(w3, addr, "latest")
-        pool_v3 = w3.eth.contract(address=addr, abi=POOL_V3_META_ABI)
-        t0 = pool_v3.functions.token0().call()
-        t1 = pool_v3.functions.token1().call()
-        d0, s0 = token_meta(w3, t0)
-        d1, s1 = token_meta(w3, t1)
-        return "v3", {"t0": t0, "t1": t1, "d0": d0, "s0": s0, "d1": d1, "s1": s1}
-    except Exception:
-        pool_v2 = w3.eth.contract(address=addr, abi=POOL_V2_ABI)
-        # a basic call to confirm v2 shape
-        r0, r1, _ = pool_v2.functions.getReserves().call()
-        t0 = pool_v2.functions.token0().call()
-        t1 = pool_v2.functions.token1().call()
-        d0, s0 = token_meta(w3, t0)
-        d1, s1 = token_meta(w3, t1)
-        return "v2", {"t0": t0, "t1": t1, "d0": d0, "s0": s0, "d1": d1, "s1": s1}
+    slot0, reserves, r_t0, r_t1 = [_result_bytes(r) for r in rpc_batch([
+        _eth_call(addr, SEL_SLOT0), _eth_call(addr, SEL_GET_RESERVES),
+        _eth_call(addr, SEL_TOKEN0), _eth_call(addr, SEL_TOKEN1),
+    ])]
+    if len(slot0) >= 32 and int.from_bytes(slot0[0:32], "big") != 0:
+        pool_type = "v3"
+    elif len(reserves) >= 96:
+        pool_type = "v2"
+    else:
+        raise RuntimeError("Pool answers neither slot0() nor getReserves()")
+    if not r_t0 or not r_t1:
+        raise RuntimeError("token0()/token1() returned no data")
+    t0 = Web3.to_checksum_address(abi_decode(["address"], r_t0)[0])
+    t1 = Web3.to_checksum_address(abi_decode(["address"], r_t1)[0])
+
+    r_d0, r_s0, r_d1, r_s1 = [_result_bytes(r) for r in rpc_batch([
+        _eth_call(t0, SEL_DECIMALS), _eth_call(t0, SEL_SYMBOL), _eth_call(t1, SEL_DECIMALS), _eth_call(t1, SEL_SYMBOL),
+    ])]
+    if not all((r_d0, r_s0, r_d1, r_s1)):
+        raise RuntimeError("decimals()/symbol() returned no data")
+    d0, d1 = abi_decode(["uint8"], r_d0)[0], abi_decode(["uint8"], r_d1)[0]
+    s0, s1 = abi_decode(["string"], r_s0)[0], abi_decode(["string"], r_s1)[0]
+    return pool_type, {"t0": t0, "t1": t1, "d0": int(d0), "s0": s0, "d1": int(d1), "s1": s1}
 
 # ----------------------- Faster block finding with cache ----------------------
 class BlockFinder:
     def __init__(self, w3: Web3):
         self.w3 = w3
         self._cache_by_minute: Dict[int, int] = {}
+        self._ts_by_block: Dict[int, int] = {}  # every header probed this run
         self._latest_num = None
         self._latest_ts = None
         self.rpc_calls = 0
         self._lock = threading.Lock()
 
-    def _get_block(self, num: int):
-        b = self.w3.eth.get_block(num)
-        with self._lock:
-            self.rpc_calls += 1
-        return b
+    def _get_blocks_ts(self, nums: List[int]) -> List[int]:
+        """Timestamps of the given blocks; cache misses go out in one batched POST (header only)."""
+        miss = [n for n in dict.fromkeys(nums) if n not in self._ts_by_block]
+        if miss:
+            res = rpc_batch([("eth_getBlockByNumber", [hex(n), False]) for n in miss])
+            with self._lock:
+                self.rpc_calls += len(miss)
+            if any(not isinstance(b, dict) for b in res):
+                raise RuntimeError("eth_getBlockByNumber failed")
+            for n, b in zip(miss, res):
+                self._ts_by_block[n] = int(b["timestamp"], 16)
+        return [self._ts_by_block[n] for n in nums]
+
+    def _get_block_ts(self, num: int) -> int:
+        return self._get_blocks_ts([num])[0]
 
     def _ensure_latest(self):
         if self._latest_num is None:
-            self._latest_num = self.w3.eth.block_number
-            latest = self._get_block(self._latest_num)
-            self._latest_ts = int(latest.timestamp)
-
-    def _binary_search(self, target_ts: int) -> int:
-        self._ensure_latest()
+            self._latest_num = int(rpc_call("eth_blockNumber", []), 16)
+            self._latest_ts = self._get_block_ts(self._latest_num)
+
+    def _locate(self, target_ts: int, lo: int, lo_ts: int) -> int:
+        """
+        Last block with timestamp <= target_ts, given ts(lo) <= target_ts.
+        The first probes interpolate inside [lo, latest] from the observed block time (usually
+        one round-trip on Linea's steady ~2s blocks); after that it falls back to bisection.
+        """
         if self._latest_ts <= target_ts:
             return int(self._latest_num)
-        low = 1
-        high = self._latest_num
-        while low <= high:
-            mid = (low + high) // 2
-            b = self._get_block(mid)
-            ts = int(b.timestamp)
-            if ts > target_ts:
-                high = mid - 1
+        hi, hi_ts = self._latest_num, self._latest_ts  # invariant: ts(lo) <= target < ts(hi)
+        step = 0
+        while hi - lo > 1:
+            if step < 3:
+                guess = lo + (target_ts - lo_ts) * (hi - lo) // max(hi_ts - lo_ts, 1)
+            else:
+                guess = (lo + hi) // 2
+            guess = min(max(guess, lo + 1), hi - 1)
+            # guess and its successor share one round-trip
+            g_ts, n_ts = self._get_blocks_ts([guess, guess + 1])
+            if g_ts <= target_ts < n_ts:
+                return guess
+            if g_ts > target_ts:
+                hi, hi_ts = guess, g_ts
             else:
-                nb = self._get_block(min(mid + 1, self._latest_num))
-                nts = int(nb.timestamp)
-                if nts > target_ts:
-                    return int(mid)
-                low = mid + 1
-        return max(1, high)
-
-    def find_before(self, target_ts: int, hint_block: Optional[int] = None, local_step_limit: int = 64) -> int:
-        key = (target_ts // 60) * 60
-        hit = self._cache_by_minute.get(key)
-        if hit:
-            return hit
-
-        if hint_block:
-            cur = max(1, hint_block)
-            step = 0
-            b = self._get_block(cur)
-            while step < local_step_limit and int(b.timestamp) <= target_ts and cur < self.w3.eth.block_number:
-                cur += 1
-                b = self._get_block(cur)
-                step += 1
-            if int(b.timestamp) > target_ts:
-                ans = max(1, cur - 1)
+                lo, lo_ts = guess + 1, n_ts
+            step += 1
+        return lo
+
+    def sweep(self, sorted_ts: Iterable[int]):
+        """
+        Yield find_before(ts) for ascending timestamps (None where the lookup failed).
+        Each search starts at the previous answer (the cursor), so a sorted batch costs about
+        one probe per distinct minute instead of a full binary search per row.
+        """
+        self._ensure_latest()
+        lo = lo_ts = None
+        for target_ts in sorted_ts:
+            key = (target_ts // 60) * 60
+            hit = self._cache_by_minute.get(key)
+            # A minute answer loaded from CACHE_DB may come from a later second of that minute
+            if hit and self._ts_by_block.get(hit, target_ts) <= target_ts:
+                yield hit
+                continue
+            try:
+                if lo is None or lo_ts > target_ts:
+                    lo, lo_ts = 1, self._get_block_ts(1)
+                ans = 1 if target_ts < lo_ts else self._locate(target_ts, lo, lo_ts)
                 self._cache_by_minute[key] = ans
-                return ans
+                lo, lo_ts = ans, self._get_block_ts(ans)
+                yield ans
+            except Exception:
+                yield None
 
-        ans = self._binary_search(target_ts)
-        self._cache_by_minute[key] = ans
+    def find_before(self, target_ts: int) -> int:
+        ans = next(self.sweep([target_ts]))
+        if ans is None:
+            raise RuntimeError(f"Could not resolve block for ts={target_ts}")
         return ans
 
+def _cache_db() -> sqlite3.Connection:
+    CACHE_DB.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(CACHE_DB)
+    # Same schema as A02 (which also keeps pool_state there), so either script can create the file
+    con.executescript(
+        "CREATE TABLE IF NOT EXISTS block_ts (block INTEGER PRIMARY KEY, ts INTEGER NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS minute_block (minute INTEGER PRIMARY KEY, block INTEGER NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS pool_state (pool TEXT NOT NULL, kind TEXT NOT NULL, block INTEGER NOT NULL,"
+        " data TEXT NOT NULL, PRIMARY KEY (pool, kind, block));"
+        "CREATE TABLE IF NOT EXISTS pool_meta (pool TEXT PRIMARY KEY, pool_type TEXT NOT NULL, data TEXT NOT NULL);"
+    )
+    return con
+
+_persisted: Dict[str, Set[int]] = {"block_ts": set(), "minute_block": set()}
+
+def load_cache(bf: BlockFinder):
+    """Seed bf's header/minute maps from CACHE_DB (missing or unreadable -> cold start)."""
+    if not CACHE_DB.exists():
+        return
+    try:
+        con = _cache_db()
+        try:
+            bf._ts_by_block.update(con.execute("SELECT block, ts FROM block_ts"))
+            bf._cache_by_minute.update(con.execute("SELECT minute, block FROM minute_block"))
+        finally:
+            con.close()
+    except Exception:
+        return
+    _persisted["block_ts"] = set(bf._ts_by_block)
+    _persisted["minute_block"] = set(bf._cache_by_minute)
+
+def flush_cache(bf: BlockFinder):
+    """Write final entries added since load_cache to CACHE_DB in one transaction."""
+    if bf._latest_num is None:
+        return
+    final = bf._latest_num - FINALITY_MARGIN
+    blocks = [(b, t) for b, t in list(bf._ts_by_block.items())
+              if b <= final and b not in _persisted["block_ts"]]
+    minutes = [(m, b) for m, b in list(bf._cache_by_minute.items())
+               if b <= final and m not in _persisted["minute_block"]]
+    if not (blocks or minutes):
+        return
+    try:
+        con = _cache_db()
+        try:
+            with con:
+                con.executemany("INSERT OR IGNORE INTO block_ts (block, ts) VALUES (?, ?)", blocks)
+                con.executemany("INSERT OR REPLACE INTO minute_block (minute, block) VALUES (?, ?)", minutes)
+        finally:
+            con.close()
+    except Exception:
+        return
+    _persisted["block_ts"].update(b for b, _ in blocks)
+    _persisted["minute_block"].update(m for m, _ in minutes)
+
+def _pool_shape_ok(addr: str, pool_type: str) -> bool:
+    """One eth_call confirming the pool still answers like the cached pool_type."""
+    if pool_type == "v3":
+        slot0 = _result_bytes(rpc_call(*_eth_call(addr, SEL_SLOT0)))
+        return len(slot0) >= 32 and int.from_bytes(slot0[0:32], "big") != 0
+    return len(_result_bytes(rpc_call(*_eth_call(addr, SEL_GET_RESERVES)))) >= 96
+
+def pool_type_and_meta(w3: Web3, addr: str):
+    """
+    detect_pool_type_and_meta, remembered per pool in CACHE_DB (token addresses, decimals and
+    symbols never change). A cached entry is trusted after one shape check instead of two
+    batched detection POSTs; if the check fails, the pool is detected again and re-cached.
+    """
+    key = addr.lower()
+    try:
+        con = _cache_db()
+        try:
+            hit = con.execute("SELECT pool_type, data FROM pool_meta WHERE pool = ?", (key,)).fetchone()
+        finally:
+            con.close()
+    except Exception:
+        hit = None
+    if hit:
+        try:
+            if _pool_shape_ok(addr, hit[0]):
+                return hit[0], json.loads(hit[1])
+        except Exception:
+            pass
+    pool_type, meta = detect_pool_type_and_meta(w3, addr)
+    try:
+        con = _cache_db()
+        try:
+            with con:
+                con.execute("INSERT OR REPLACE INTO pool_meta (pool, pool_type, data) VALUES (?, ?, ?)",
+                            (key, pool_type, json.dumps(meta)))
+        finally:
+            con.close()
+    except Exception:
+        pass
+    return pool_type, meta
+
 # ---------------------------------- Ratios -----------------------------------
-def get_ratios_at_block(w3: Web3, pool_type: str, meta: Dict[str, Any], block_tag: int) -> Dict[str, Any]:
+def get_ratios_at_block(pool_type: str, meta: Dict[str, Any], block_tag: int) -> Dict[str, Any]:
     """
-    Returns dict with "ratios" where keys are "SYMA/SYMB" -> Decimal(price of SYMA in SYMB).
+    Returns dict with "ratios" where keys are "SYMA/SYMB" -> exact Ratio (price of SYMA in SYMB).
     """
     if pool_type == "v3":
-        sqrtPriceX96 = read_v3_sqrtPriceX96_raw(w3, POOL_ADDRESS, block_tag)
+        sqrtPriceX96 = read_v3_sqrtPriceX96_raw(POOL_ADDRESS, block_tag)
         price1_per_0_raw = price_from_sqrtPriceX96(sqrtPriceX96)
-        adj = Decimal(10) ** Decimal(meta["d0"] - meta["d1"])
-        token1_per_token0 = price1_per_0_raw * adj      # how many token1 per token0
-        token0_per_token1 = Decimal(1) / token1_per_token0
+        token1_per_token0 = _scale_decimals(price1_per_0_raw, meta["d0"], meta["d1"])  # how many token1 per token0
     else:
-        pool = w3.eth.contract(address=POOL_ADDRESS, abi=POOL_V2_ABI)
-        r0, r1, _ = pool.functions.getReserves().call(block_identifier=block_tag)
-        r0 = Decimal(r0)
-        r1 = Decimal(r1)
-        token1_per_token0 = (r1 / r0) * (Decimal(10) ** Decimal(meta["d0"] - meta["d1"]))
-        token0_per_token1 = Decimal(1) / token1_per_token0
+        r0, r1 = read_v2_reserves_raw(POOL_ADDRESS, block_tag)
+        if r0 == 0 or r1 == 0:
+            raise RuntimeError("getReserves() returned an empty reserve")
+        token1_per_token0 = _scale_decimals((r1, r0), meta["d0"], meta["d1"])
+    token0_per_token1 = _inv(token1_per_token0)
 
     return {
         "ratios": {
@@ -223,28 +424,17 @@ def get_ratios_at_block(w3: Web3, pool_type: str, meta: Dict[str, Any], block_ta
 # ------------------------------ CSV helpers ----------------------------------
 NEW_COLS = ["rex_per_usdc", "usdc_per_rex", "onchaindata_source"]
 
-def sniff_header(path: Path) -> List[str]:
-    if not path.exists():
-        return []
-    with path.open(newline="", encoding="utf-8") as f:
-        r = csv.reader(f)
-        header = next(r, None)
-        return header or []
+def read_csv_frame(path: Path) -> pd.DataFrame:
+    """CSV as all-text columns (C parser); empty cells stay "". Missing/empty file -> no columns."""
+    if not path.exists() or path.stat().st_size == 0:
+        return pd.DataFrame()
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8")
 
-def read_csv_dicts(path: Path) -> List[Dict[str, Any]]:
-    if not path.exists():
-        return []
-    with path.open(newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return [dict(row) for row in reader]
-
-def write_all_atomic(path: Path, temp_path: Path, rows: List[Dict[str, Any]], fieldnames: List[str]):
+def write_all_atomic(path: Path, temp_path: Path, df: pd.DataFrame, fieldnames: List[str]):
+    """Whole table to temp_path in fieldnames order, then rename over path (same bytes csv.DictWriter produced)."""
     path.parent.mkdir(parents=True, exist_ok=True)
-    with temp_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for r in rows:
-            writer.writerow({k: r.get(k, "") for k in fieldnames})
+    df = df.reindex(columns=fieldnames, fill_value="")
+    df.to_csv(temp_path, index=False, encoding="utf-8", lineterminator="\r\n")
     temp_path.replace(path)
 
 def union_preserve_order(base: Iterable[str], add: Iterable[str]) -> List[str]:
@@ -282,6 +472,60 @@ def parse_tx_time_for_sort(row: Dict[str, Any]) -> int:
     dt = parse_tx_time_to_utc(s)
     return int(dt.timestamp()) if dt else 0
 
+# A01 writes "YYYY-MM-DD HH:MM:SS CET|CEST"; the abbreviation pins the UTC offset
+_TX_TIME_RE = r"^\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\s*([A-Za-z]+)\s*$"
+_TZ_ABBREV_OFFSET_S = {"CEST": 7200, "CET": 3600, "UTC": 0, "GMT": 0}
+
+def tx_times_to_unix(values: Iterable[str]) -> List[Optional[int]]:
+    """
+    Vectorized parse_tx_time_to_utc -> unix seconds (None where unparseable).
+    Each distinct string is parsed once (txs of one block share it): strings in the A01 format
+    in one pandas pass, anything else through dateutil.
+    """
+    s = pd.Series(list(values), dtype=object).fillna("").astype(str)
+    if s.empty:
+        return []
+    codes, uniq = pd.factorize(s)
+    u = pd.Series(uniq, dtype=object)
+    parts = u.str.extract(_TX_TIME_RE)
+    wall = pd.to_datetime(parts[0], format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    wall_s = (wall - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    offset = parts[1].map(_TZ_ABBREV_OFFSET_S)
+    parsed: List[Optional[int]] = []
+    for raw, ts in zip(u.tolist(), (wall_s - offset).tolist()):
+        if ts == ts:  # not NaN
+            parsed.append(int(ts))
+        else:
+            dt = parse_tx_time_to_utc(raw.strip())
+            parsed.append(int(dt.timestamp()) if dt else None)
+    return [parsed[c] for c in codes]
+
+def sort_key_column(df: pd.DataFrame) -> pd.Series:
+    """parse_tx_time_for_sort for a whole frame (0 where unparseable)."""
+    if "tx_timestamp" not in df:
+        return pd.Series(0, index=df.index, dtype="int64")
+    return pd.Series([ts or 0 for ts in tx_times_to_unix(df["tx_timestamp"])], index=df.index, dtype="int64")
+
+def unix_ts_column(df: pd.DataFrame) -> pd.Series:
+    """
+    row_to_unix_ts for a whole frame: block_time where it is an integer, else the parsed
+    tx_timestamp (<NA> if neither resolves).
+    """
+    bt = df["block_time"].str.strip() if "block_time" in df else pd.Series("", index=df.index)
+    is_int = bt.str.fullmatch(r"[+-]?\d+").fillna(False).astype(bool)
+    out = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    out[is_int] = bt[is_int].astype("int64")
+    rest = ~is_int
+    if rest.any():
+        tx = df.loc[rest, "tx_timestamp"] if "tx_timestamp" in df else [""] * int(rest.sum())
+        out[rest] = pd.array(tx_times_to_unix(tx), dtype="Int64")
+    return out
+
+def sort_latest_first(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows latest -> oldest by tx_timestamp (unparseable last); ties keep their current order."""
+    keys = sort_key_column(df)
+    return df.loc[keys.sort_values(ascending=False, kind="stable").index]
+
 def row_to_unix_ts(row: Dict[str, Any]) -> int:
     bt = (row.get("block_time") or "").strip()
     if bt:
@@ -294,12 +538,17 @@ def row_to_unix_ts(row: Dict[str, Any]) -> int:
         raise ValueError("Cannot resolve timestamp for row")
     return int(dt_utc.timestamp())
 
-def existing_hashes(rows: List[Dict[str, Any]]) -> Set[str]:
-    return {(r.get("tx_hash") or "").lower() for r in rows if r.get("tx_hash")}
+def existing_hashes(df: pd.DataFrame) -> Set[str]:
+    """Lower-cased tx_hash set of the output frame, built in one pass over the column."""
+    if "tx_hash" not in df:
+        return set()
+    done = set(df["tx_hash"].str.lower())
+    done.discard("")  # in place: `- {""}` would copy the whole set
+    return done
 
-def extract_pair_ratios_for_rex_usdc(meta: Dict[str, Any], ratios: Dict[str, Decimal]) -> Tuple[Decimal, Decimal]:
+def extract_pair_ratios_for_rex_usdc(meta: Dict[str, Any], ratios: Dict[str, Ratio]) -> Tuple[Ratio, Ratio]:
     """
-    Extracts REX/USDC and USDC/REX Decimals from a ratios dict that may be keyed by pool token symbols.
+    Extracts REX/USDC and USDC/REX Ratios from a ratios dict that may be keyed by pool token symbols.
     """
     s0 = (meta["s0"] or "").upper()
     s1 = (meta["s1"] or "").upper()
@@ -317,9 +566,9 @@ def extract_pair_ratios_for_rex_usdc(meta: Dict[str, Any], ratios: Dict[str, Dec
 
     # Fill via inverse if one side missing
     if rex_per_usdc is None and usdc_per_rex is not None:
-        rex_per_usdc = Decimal(1) / usdc_per_rex
+        rex_per_usdc = _inv(usdc_per_rex)
     if usdc_per_rex is None and rex_per_usdc is not None:
-        usdc_per_rex = Decimal(1) / rex_per_usdc
+        usdc_per_rex = _inv(rex_per_usdc)
 
     # As a fallback, try mapping via discovered token symbols
     if rex_per_usdc is None or usdc_per_rex is None:
@@ -328,17 +577,17 @@ def extract_pair_ratios_for_rex_usdc(meta: Dict[str, Any], ratios: Dict[str, Dec
         val_a = ratios.get(key_a)
         val_b = ratios.get(key_b)
         if s0 == "REX" and s1 == "USDC":
-            rex_per_usdc = val_a or (Decimal(1) / val_b if val_b else None)
-            usdc_per_rex = (Decimal(1) / rex_per_usdc) if rex_per_usdc is not None else None
+            rex_per_usdc = val_a or (_inv(val_b) if val_b else None)
+            usdc_per_rex = _inv(rex_per_usdc) if rex_per_usdc is not None else None
         elif s0 == "USDC" and s1 == "REX":
-            usdc_per_rex = val_a or (Decimal(1) / val_b if val_b else None)
-            rex_per_usdc = (Decimal(1) / usdc_per_rex) if usdc_per_rex is not None else None
+            usdc_per_rex = val_a or (_inv(val_b) if val_b else None)
+            rex_per_usdc = _inv(usdc_per_rex) if usdc_per_rex is not None else None
         elif s1 == "REX" and s0 == "USDC":
-            usdc_per_rex = val_b or (Decimal(1) / val_a if val_a else None)
-            rex_per_usdc = (Decimal(1) / usdc_per_rex) if usdc_per_rex is not None else None
+            usdc_per_rex = val_b or (_inv(val_a) if val_a else None)
+            rex_per_usdc = _inv(usdc_per_rex) if usdc_per_rex is not None else None
         elif s1 == "USDC" and s0 == "REX":
-            rex_per_usdc = val_b or (Decimal(1) / val_a if val_a else None)
-            usdc_per_rex = (Decimal(1) / rex_per_usdc) if rex_per_usdc is not None else None
+            rex_per_usdc = val_b or (_inv(val_a) if val_a else None)
+            usdc_per_rex = _inv(rex_per_usdc) if rex_per_usdc is not None else None
 
     if rex_per_usdc is None or usdc_per_rex is None:
         raise RuntimeError(
@@ -347,20 +596,22 @@ def extract_pair_ratios_for_rex_usdc(meta: Dict[str, Any], ratios: Dict[str, Dec
 
     return rex_per_usdc, usdc_per_rex
 
+def get_rex_usdc_at_block(pool_type: str, meta: Dict[str, Any], block_tag: int) -> Tuple[Ratio, Ratio]:
+    """(rex_per_usdc, usdc_per_rex) at block_tag; stage 2 calls this once per distinct block."""
+    hist = get_ratios_at_block(pool_type, meta, block_tag)
+    return extract_pair_ratios_for_rex_usdc(meta, hist["ratios"])
+
 # ------------------------------ Processing core ------------------------------
-def process_row(w3: Web3, pool_type: str, meta: Dict[str, Any], bf: BlockFinder, row: Dict[str, Any], hint_block: Optional[int]):
-    unix_ts = row_to_unix_ts(row)
-    block_tag = bf.find_before(unix_ts, hint_block=hint_block)
-    hist = get_ratios_at_block(w3, pool_type, meta, block_tag)
-    rex_per_usdc, usdc_per_rex = extract_pair_ratios_for_rex_usdc(meta, hist["ratios"])
+def process_row(row: Dict[str, Any], block_tag: int, prices: Tuple[str, str]):
+    unix_ts = row["_unix_ts"]
+    rex_per_usdc, usdc_per_rex = prices  # already formatted, once per block
 
     out_row = dict(row)  # preserve all imported columns
-    out_row["rex_per_usdc"] = f"{rex_per_usdc:.18f}"
-    out_row["usdc_per_rex"] = f"{usdc_per_rex:.18f}"
+    out_row["rex_per_usdc"] = rex_per_usdc
+    out_row["usdc_per_rex"] = usdc_per_rex
     out_row["onchaindata_source"] = out_row.get("onchaindata_source") or "dexscreener.com"
     out_row["_block_tag"] = block_tag
     out_row["_unix_ts"] = unix_ts
-    out_row["_sort_ts"] = parse_tx_time_for_sort(out_row)
     return out_row
 
 # ------------------------------ CLI look & feel ------------------------------
@@ -376,9 +627,21 @@ def _progress_line(done: int, total: int) -> str:
     bar = "█" * filled + " " * (_BAR_WIDTH - filled)
     return f"[PROGRESS {pct:>3}%] |{bar}|"
 
+_PROGRESS_INTERVAL_S = 0.05
+_last_draw = {"t": 0.0, "line": ""}
+
 def print_progress(done: int, total: int):
+    """Redraw at most every _PROGRESS_INTERVAL_S (always the first and final step), and only on change."""
+    now = time.monotonic()
+    if 0 < done < total and now - _last_draw["t"] < _PROGRESS_INTERVAL_S:
+        return
     line = _progress_line(done, total)
-    print("\r" + line, end="", flush=True)
+    if line == _last_draw["line"]:
+        return
+    _last_draw["t"] = now
+    _last_draw["line"] = line
+    sys.stdout.write("\r" + line)
+    sys.stdout.flush()
 
 def finish_progress():
     print("\r" + _progress_line(100, 100), flush=True)
@@ -396,160 +659,155 @@ def plan_fieldnames(input_headers: List[str], existing_headers: List[str]) -> Li
     base = union_preserve_order(base, input_headers)           # ensure all input columns in original order
     return base + NEW_COLS
 
-def ensure_defaults_for_existing(rows: List[Dict[str, Any]]):
+def ensure_defaults_for_existing(df: pd.DataFrame) -> pd.DataFrame:
     """
     Retro-fill existing rows with required columns:
     - Do not overwrite existing non-empty values
     - Always ensure onchaindata_source defaults to 'dexscreener.com' if empty/missing
     """
-    for r in rows:
-        if "rex_per_usdc" not in r:
-            r["rex_per_usdc"] = r.get("rex_per_usdc", "")
-        if "usdc_per_rex" not in r:
-            r["usdc_per_rex"] = r.get("usdc_per_rex", "")
-        if not r.get("onchaindata_source"):
-            r["onchaindata_source"] = "dexscreener.com"
-
-def run_incremental(workers: int = 4) -> Dict[str, Any]:
+    for c in NEW_COLS:
+        if c not in df:
+            df[c] = ""
+    df.loc[df["onchaindata_source"] == "", "onchaindata_source"] = "dexscreener.com"
+    return df
+
+def run_incremental(workers: int = PRICE_WORKERS) -> Dict[str, Any]:
     # Load input + existing output
-    input_headers = sniff_header(INPUT_CSV)
-    raw_rows = read_csv_dicts(INPUT_CSV)
+    raw_df = read_csv_frame(INPUT_CSV)
+    input_headers = list(raw_df.columns)
 
-    existing_rows = read_csv_dicts(OUTPUT_CSV)
-    existing_headers = sniff_header(OUTPUT_CSV)
+    existing_df = read_csv_frame(OUTPUT_CSV)
+    existing_headers = list(existing_df.columns)
 
-    # Retro-fill existing data with defaults (doesn't overwrite non-empty)
-    ensure_defaults_for_existing(existing_rows)
+    # Retro-fill existing data with defaults (doesn't overwrite non-empty); skipped when every
+    # row already carries them, which is the normal case for a file this script wrote
+    needs_defaults = (not set(NEW_COLS).issubset(existing_headers)
+                      or bool((existing_df["onchaindata_source"] == "").any()))
+    if needs_defaults:
+        existing_df = ensure_defaults_for_existing(existing_df)
 
     # Decide final field order
     out_fieldnames = plan_fieldnames(input_headers, existing_headers)
 
     # Compute set of hashes already present
-    done_hashes = existing_hashes(existing_rows)
-
-    already = 0
-    todo_rows: List[Dict[str, Any]] = []
-    seen_this_batch: Set[str] = set()
-    for r in raw_rows:
-        h = (r.get("tx_hash") or "").lower()
-        if not h:
-            continue
-        if h in done_hashes:
-            already += 1
-            continue
-        if h in seen_this_batch:
-            continue
-        seen_this_batch.add(h)
-        todo_rows.append(r)
+    done_hashes = existing_hashes(existing_df)
+
+    # New work: non-empty hash, not in the output yet, first occurrence only; only this
+    # slice becomes row dicts
+    h = raw_df["tx_hash"].str.lower() if "tx_hash" in raw_df else pd.Series("", index=raw_df.index)
+    is_done = h.isin(done_hashes)
+    already = int(is_done.sum())
+    todo_df = raw_df[(h != "") & ~is_done & ~h.duplicated()]
 
     print_info("")
-    print_info(f"Loaded {len(raw_rows)} raw rows; {already} already fetched")
-    print_info(f"Fetching price for {len(todo_rows)} transaction(s)...")
+    print_info(f"Loaded {len(raw_df)} raw rows; {already} already fetched")
+    print_info(f"Fetching price for {len(todo_df)} transaction(s)...")
 
-    total_to_do = len(todo_rows)
+    total_to_do = len(todo_df)
 
     if total_to_do == 0:
-        # Sort existing rows latest->oldest by tx_timestamp for consistency
-        for r in existing_rows:
-            r["_sort_ts"] = parse_tx_time_for_sort(r)
-        existing_rows.sort(key=lambda r: r["_sort_ts"], reverse=True)
-        for r in existing_rows:
-            r.pop("_sort_ts", None)
+        # Sort existing rows latest->oldest by tx_timestamp for consistency; a file that is
+        # already sorted, complete and in final column order is left untouched
+        keys = sort_key_column(existing_df)
         finish_progress()
-        write_all_atomic(OUTPUT_CSV, OUTPUT_TMP, existing_rows, out_fieldnames)
-        print_info(f"Finished. New: 0 success, 0 failed. Total written: {len(existing_rows)} rows.")
+        if needs_defaults or existing_headers != out_fieldnames or not keys.is_monotonic_decreasing:
+            existing_df = existing_df.loc[keys.sort_values(ascending=False, kind="stable").index]
+            write_all_atomic(OUTPUT_CSV, OUTPUT_TMP, existing_df, out_fieldnames)
+        print_info(f"Finished. New: 0 success, 0 failed. Total written: {len(existing_df)} rows.")
         print_info(f"Output: {str(OUTPUT_CSV).lower()}")
         return {
             "new_success": 0,
             "new_failed": 0,
-            "total_written": len(existing_rows)
+            "total_written": len(existing_df)
         }
 
     # Prepare chain
     w3 = connect()
-    pool_type, meta = detect_pool_type_and_meta(w3, POOL_ADDRESS)
+    pool_type, meta = pool_type_and_meta(w3, POOL_ADDRESS)
     bf = BlockFinder(w3)
+    load_cache(bf)
 
-    # Resolve timestamps early for better caching
-    resolved = []
-    for r in todo_rows:
-        try:
-            ts = row_to_unix_ts(r)
-            r["_unix_ts"] = ts
-            r["_sort_ts"] = parse_tx_time_for_sort(r)
-            resolved.append(r)
-        except Exception:
-            # skip rows we can't timestamp
-            pass
-    resolved.sort(key=lambda x: x["_unix_ts"])
+    # Resolve timestamps early for better caching (one vectorized pass); rows we can't
+    # timestamp are skipped. Only this slice becomes row dicts.
+    todo_df = todo_df.assign(_unix_ts=unix_ts_column(todo_df)).dropna(subset=["_unix_ts"])
+    todo_df["_unix_ts"] = todo_df["_unix_ts"].astype("int64")
+    resolved: List[Dict[str, Any]] = todo_df.sort_values("_unix_ts", kind="stable").to_dict("records")
     total_to_do = len(resolved)
 
     produced = 0
     failed = 0
     out_rows: List[Dict[str, Any]] = []
-    hint_for_chunk = None
 
-    # initial progress line (0%)
-    print_progress(0, total_to_do)
+    # Progress covers both stages: one step per block lookup, one per price read
+    total_steps = 2 * total_to_do
+    steps = 0
+    print_progress(0, total_steps)
 
     start = time.time()
-    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
-        futures = [ex.submit(process_row, w3, pool_type, meta, bf, r, hint_for_chunk) for r in resolved]
-        for fut in as_completed(futures):
-            try:
-                out_row = fut.result()
-                out_rows.append(out_row)
-                produced += 1
-                hint_for_chunk = out_row["_block_tag"]
-            except Exception:
+    try:
+        # Stage 1: timestamp -> block, one forward sweep over the ascending timestamps
+        blocks: List[Tuple[Dict[str, Any], int]] = []
+        for r, block_tag in zip(resolved, bf.sweep(r["_unix_ts"] for r in resolved)):
+            if block_tag is None:
                 failed += 1
-            print_progress(produced + failed, total_to_do)
-
-    # Clean internals for new rows
-    for r in out_rows:
-        r.pop("_unix_ts", None)
-        r.pop("_block_tag", None)
-
-    # Merge: existing + new (avoid duplicates)
-    merged_rows = list(existing_rows)
-    existing_set = existing_hashes(existing_rows)
-    for r in out_rows:
-        if (r.get("tx_hash") or "").lower() not in existing_set:
-            # Ensure all NEW_COLS exist; default onchaindata_source to dexscreener.com
-            for c in NEW_COLS:
-                if c == "onchaindata_source":
-                    r.setdefault(c, "dexscreener.com")
-                else:
-                    r.setdefault(c, "")
-            merged_rows.append(r)
+            else:
+                blocks.append((r, block_tag))
+            steps += 1
+            print_progress(steps, total_steps)
+        total_steps = steps + len(blocks)
+
+        # Stage 2: price once per distinct block, then fan the result out to every row in it.
+        # Only the RPC reads run on the pool; the output rows are built here on the main thread.
+        rows_by_block: Dict[int, List[Dict[str, Any]]] = {}
+        for r, block_tag in blocks:
+            rows_by_block.setdefault(block_tag, []).append(r)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            futures = {ex.submit(get_rex_usdc_at_block, pool_type, meta, block_tag): block_tag
+                       for block_tag in rows_by_block}
+            for fut in as_completed(futures):
+                block_tag = futures[fut]
+                rows = rows_by_block[block_tag]
+                try:
+                    rex_per_usdc, usdc_per_rex = fut.result()
+                    prices = (format_ratio(rex_per_usdc), format_ratio(usdc_per_rex))
+                    out_rows.extend(process_row(r, block_tag, prices) for r in rows)
+                    produced += len(rows)
+                except Exception:
+                    failed += len(rows)
+                steps += len(rows)
+                print_progress(steps, total_steps)
+    finally:
+        flush_cache(bf)  # keep whatever was resolved, even if the run was interrupted
+
+    # Merge: existing + new (avoid duplicates); selecting out_fieldnames drops the internals
+    new_df = pd.DataFrame(out_rows).reindex(columns=out_fieldnames, fill_value="")
+    if not new_df.empty:
+        new_df = new_df[~new_df["tx_hash"].str.lower().isin(done_hashes)]
+    merged = pd.concat([existing_df.reindex(columns=out_fieldnames, fill_value=""), new_df], ignore_index=True)
 
     # Sort latest -> oldest by tx_timestamp
-    for r in merged_rows:
-        r["_sort_ts"] = parse_tx_time_for_sort(r)
-    merged_rows.sort(key=lambda r: r["_sort_ts"], reverse=True)
-    for r in merged_rows:
-        r.pop("_sort_ts", None)
+    merged = sort_latest_first(merged)
 
     # Write atomically with the final field order (imported columns + new at end)
-    write_all_atomic(OUTPUT_CSV, OUTPUT_TMP, merged_rows, out_fieldnames)
+    write_all_atomic(OUTPUT_CSV, OUTPUT_TMP, merged, out_fieldnames)
 
     # Final console (no extra blank line)
     finish_progress()
     elapsed = time.time() - start
-    print_info(f"Finished. New: {produced - failed} success, {failed} failed. Total written: {len(merged_rows)} rows.")
+    print_info(f"Finished. New: {produced - failed} success, {failed} failed. Total written: {len(merged)} rows.")
     print_info(f"Output: {str(OUTPUT_CSV).lower()}")
 
     return {
         "new_success": produced - failed,
         "new_failed": failed,
-        "total_written": len(merged_rows),
+        "total_written": len(merged),
         "elapsed_sec": round(elapsed, 2),
     }
 
 # ---------------------------------- Main -------------------------------------
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--workers", type=int, default=min(4, (os.cpu_count() or 4)))
+    parser.add_argument("--workers", type=int, default=PRICE_WORKERS)
     args = parser.parse_args()
     run_incremental(workers=args.workers)
 
@@ -557,4 +815,4 @@ if __name__ == "__main__":
     main()
 
 # A02_onchain_price_REX_USDC.py
-# Software Version 1.4
+# Software Version 3.2
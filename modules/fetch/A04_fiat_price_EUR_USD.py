@@ -2,20 +2,32 @@
 # fetches USD/EUR and EUR/USD rates for each timestamp’s UTC day,
 # and appends ONLY NEW results to database/data_price_usd_eur.csv.
 # Output and logging adopt the requested CLI layout/style (info lines, progress bar, summary).
-# Software Version 2.4
+# Software Version 3.2
 # NOTE for future maintainers (including AI):
 # Every time you update this code, please increase the Software Version by +0.1
 
 import requests
-from decimal import Decimal
+from requests.adapters import HTTPAdapter
+import pandas as pd
 import csv
 from pathlib import Path
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, date, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 import sys
+import time
 import math
 
 TIMEOUT = 5  # seconds
 PROGRESS_BAR_WIDTH = 40
+FX_WORKERS = 8  # dates fetched in parallel (one HTTP call per UTC date, not per tx)
+
+# One keep-alive session for the whole run: each FX host pays one TLS handshake per pooled
+# connection, and the pool holds a connection per FX_WORKERS thread.
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(16, FX_WORKERS))
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
 
 # Minimal timezone abbreviation map for parsing (extend as needed)
 TZ_OFFSETS = {
@@ -29,61 +41,53 @@ TZ_OFFSETS = {
     "BST": timedelta(hours=1),
     "GMT": timedelta(hours=0),
 }
+TZINFO_BY_ABBR = {k: timezone(v) for k, v in TZ_OFFSETS.items()}  # built once, not per row
 
+@lru_cache(maxsize=65536)  # txs in the same block share the exact timestamp string
 def parse_ts_with_abbrev(ts_str: str) -> datetime:
     # Expect 'YYYY-MM-DD HH:MM:SS ZZZZ'
     parts = ts_str.rsplit(" ", 1)
     if len(parts) != 2:
         raise ValueError(f"Unsupported timestamp format: {ts_str}")
     dt_part, tz_abbr = parts[0], parts[1].strip()
-    if tz_abbr not in TZ_OFFSETS:
+    tzinfo = TZINFO_BY_ABBR.get(tz_abbr)
+    if tzinfo is None:
         raise ValueError(f"Unknown timezone abbreviation: {tz_abbr} in '{ts_str}'")
-    naive = datetime.strptime(dt_part, "%Y-%m-%d %H:%M:%S")
-    aware = naive.replace(tzinfo=timezone(TZ_OFFSETS[tz_abbr]))
+    aware = datetime.strptime(dt_part, "%Y-%m-%d %H:%M:%S").replace(tzinfo=tzinfo)
     return aware.astimezone(timezone.utc)
 
-def fetch_rate_for_date_utc(utc_dt: datetime):
-    date_str = utc_dt.strftime("%Y-%m-%d")
+def fetch_rate_for_date_utc(day: date):
+    date_str = day.strftime("%Y-%m-%d")
     # Primary: exchangerate.host
     try:
         url = f"https://api.exchangerate.host/{date_str}"
-        resp = requests.get(url, params={"base": "USD", "symbols": "EUR"}, timeout=TIMEOUT)
+        resp = _session.get(url, params={"base": "USD", "symbols": "EUR"}, timeout=TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
-        usd2eur = Decimal(str(data["rates"]["EUR"]))
-        eur2usd = Decimal("1") / usd2eur
+        usd2eur = float(data["rates"]["EUR"])  # 6-decimal output is well within float64
+        eur2usd = 1.0 / usd2eur
         return usd2eur, eur2usd, "exchangerate.host", date_str
     except Exception:
         pass
     # Fallback: frankfurter.app
     url = f"https://api.frankfurter.app/{date_str}"
-    resp = requests.get(url, params={"from": "USD", "to": "EUR"}, timeout=TIMEOUT)
+    resp = _session.get(url, params={"from": "USD", "to": "EUR"}, timeout=TIMEOUT)
     resp.raise_for_status()
     data = resp.json()
-    usd2eur = Decimal(str(data["rates"]["EUR"]))
-    eur2usd = Decimal("1") / usd2eur
+    usd2eur = float(data["rates"]["EUR"])
+    eur2usd = 1.0 / usd2eur
     return usd2eur, eur2usd, "frankfurter.app", date_str
 
-def read_existing_keys(out_csv: Path) -> set:
-    keys = set()
-    if not out_csv.exists():
-        return keys
-    with out_csv.open(mode="r", newline="") as f:
-        reader = csv.DictReader(f)
-        if "tx_hash" not in (reader.fieldnames or []):
-            return keys
-        for row in reader:
-            key = (row.get("tx_hash") or "").strip()
-            if key:
-                keys.add(key)
-    return keys
-
-def count_rows(path: Path) -> int:
-    if not path.exists():
-        return 0
-    with path.open(mode="r", newline="") as f:
-        # subtract header if present
-        return max(sum(1 for _ in f) - 1, 0)
+def read_existing(out_csv: Path):
+    """(row count, set of tx_hash) of the output in one pass; only tx_hash is materialized (C parser)."""
+    if not out_csv.exists() or out_csv.stat().st_size == 0:
+        return 0, set()
+    df = pd.read_csv(out_csv, usecols=lambda c: c == "tx_hash", dtype=str, keep_default_na=False)
+    if "tx_hash" not in df:
+        return len(df), set()
+    keys = set(df["tx_hash"].str.strip())
+    keys.discard("")  # in place: `- {""}` would copy the whole set
+    return len(df), keys
 
 def save_rows(output_path: Path, header: list, rows: list):
     file_exists = output_path.exists()
@@ -93,7 +97,14 @@ def save_rows(output_path: Path, header: list, rows: list):
             writer.writerow(header)
         writer.writerows(rows)
 
+_PROGRESS_INTERVAL_S = 0.05
+_last_draw = {"t": 0.0, "line": ""}
+
 def progress_bar(i: int, n: int):
+    """Redraw at most every _PROGRESS_INTERVAL_S (always the first and final step), and only on change."""
+    now = time.monotonic()
+    if 0 < i < n and now - _last_draw["t"] < _PROGRESS_INTERVAL_S:
+        return
     if n == 0:
         bar = " " * PROGRESS_BAR_WIDTH
         pct = 100
@@ -101,8 +112,12 @@ def progress_bar(i: int, n: int):
         pct = int((i / n) * 100)
         filled = math.floor((i / n) * PROGRESS_BAR_WIDTH)
         bar = "█" * filled + " " * (PROGRESS_BAR_WIDTH - filled)
-    sys.stdout.write(f"\r[PROGRESS {pct}%] |{bar}|")
-    sys.stdout.flush()
+    line = f"\r[PROGRESS {pct}%] |{bar}|"
+    if line != _last_draw["line"]:
+        _last_draw["t"] = now
+        _last_draw["line"] = line
+        sys.stdout.write(line)
+        sys.stdout.flush()
     if i == n:
         sys.stdout.write("\n")
         sys.stdout.flush()
@@ -120,7 +135,7 @@ def main():
         print(f"[INFO] Output: {out_csv}")
         return
 
-    prev_written = count_rows(out_csv)
+    prev_written, existing_keys = read_existing(out_csv)
 
     # Read input CSV
     raw_rows = 0
@@ -148,7 +163,6 @@ def main():
     fetched_in_range = len(input_rows)
     print(f"[INFO] Fetched {fetched_in_range} in range.")
 
-    existing_keys = read_existing_keys(out_csv)
     already_decoded = len(existing_keys)
     already_fetched = sum(1 for tx_hash, _, _ in input_rows if tx_hash in existing_keys)
 
@@ -177,24 +191,42 @@ def main():
     new_failed = 0
     to_append = []
 
+    # The APIs return one rate per UTC day: fetch each date once, then fan out to its rows
+    rows_per_date = {}
+    for _, _, utc_dt in to_process:
+        day = utc_dt.date()
+        rows_per_date[day] = rows_per_date.get(day, 0) + 1
+    rate_by_date = {}
     n = len(to_process)
-    for idx, (tx_hash, ts, utc_dt) in enumerate(to_process, start=1):
-        try:
-            usd2eur, eur2usd, source, date_used = fetch_rate_for_date_utc(utc_dt)
-            out_row = [
-                tx_hash,
-                ts,
-                utc_dt.isoformat(),
-                f"{usd2eur:.6f}",
-                f"{eur2usd:.6f}",
-                source,
-                date_used,
-            ]
-            to_append.append(out_row)
-            new_success += 1
-        except Exception:
+    done = 0
+    with ThreadPoolExecutor(max_workers=FX_WORKERS) as ex:
+        futures = {ex.submit(fetch_rate_for_date_utc, day): day for day in rows_per_date}
+        for fut in as_completed(futures):
+            day = futures[fut]
+            try:
+                rate_by_date[day] = fut.result()
+            except Exception:
+                pass
+            done += rows_per_date[day]
+            progress_bar(done, n)
+
+    for tx_hash, ts, utc_dt in to_process:
+        rate = rate_by_date.get(utc_dt.date())
+        if rate is None:
             new_failed += 1
-        progress_bar(idx, n)
+            continue
+        usd2eur, eur2usd, source, date_used = rate
+        out_row = [
+            tx_hash,
+            ts,
+            utc_dt.isoformat(),
+            f"{usd2eur:.6f}",
+            f"{eur2usd:.6f}",
+            source,
+            date_used,
+        ]
+        to_append.append(out_row)
+        new_success += 1
 
     if to_append:
         save_rows(out_csv, header, to_append)
@@ -206,4 +238,4 @@ def main():
 if __name__ == "__main__":
     main()
 
-# Software Version 2.4
+# Software Version 3.2
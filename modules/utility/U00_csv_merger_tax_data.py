@@ -1,18 +1,35 @@
 """
 U00_csv_merger_tax_data.py
-Version: 1.2.0
+Version: 1.12.0
 
 Merges three CSVs by tx_hash and writes a trimmed dataset with fixed schema:
 
 tx_hash,tx_timestamp,type,amount_sent,amount_received,
 rex_per_usdc,usdc_per_rex,onchaindata_source,
 usd_to_eur,eur_to_usd,forex_data_source,forex_rate_date_utc
+
+With pyarrow installed, parsing, dedup and the joins run on Arrow tables; otherwise pandas.
+Both paths produce the same file. The Arrow path keeps each deduplicated input as an IPC
+snapshot in database/.arrow_cache and re-parses a CSV only after it changed.
 """
 
 from pathlib import Path
+import csv
+import json
+import os
+import numpy as np
 import pandas as pd
-
-VERSION = "1.2.0"
+try:
+    import pyarrow as pa  # Optional (multithreaded CSV parser, hash joins without Python objects)
+    import pyarrow.compute as pc
+    import pyarrow.csv as pv
+except Exception:
+    pa = pc = pv = None  # type: ignore
+
+VERSION = "1.12.0"
+OUT_BATCH_ROWS = 65536  # Arrow path: rows handed to the CSV writer at a time
+CACHE_DIR_NAME = ".arrow_cache"  # next to the CSVs, like the fetchers' .block_cache
+DICT_COLS = {"type"}  # Arrow path: few distinct values, kept dictionary-encoded until the write
 
 OUTPUT_COLS = [
     "tx_hash",
@@ -29,32 +46,49 @@ OUTPUT_COLS = [
     "forex_rate_date_utc",
 ]
 
-def read_csv_str(path: Path) -> pd.DataFrame:
-    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+def read_csv_header(path: Path) -> list:
+    with path.open(newline="", encoding="utf-8-sig") as f:
+        return next(csv.reader(f), [])
+
+def plan_columns(headers: list) -> list:
+    """
+    Per input (txs, rex, fx), the raw header names that can reach OUTPUT_COLS. An output column
+    comes from the first file that has it (later ones would only get a _rex/_fx suffix), so
+    everything else is skipped by the parser instead of being loaded and dropped after the joins.
+    """
+    taken = set()
+    plans = []
+    for header in headers:
+        cols = [c for c in header if c.strip() == "tx_hash" or (c.strip() in OUTPUT_COLS and c.strip() not in taken)]
+        taken.update(c.strip() for c in cols)
+        plans.append(cols)
+    return plans
+
+def read_csv_str(path: Path, columns: list) -> pd.DataFrame:
+    df = pd.read_csv(path, dtype=str, keep_default_na=False, usecols=lambda c: c in columns)
     df.columns = [c.strip() for c in df.columns]
     return df
 
-def main():
-    print(f"Version: {VERSION}")
-
-    repo_root = Path(__file__).resolve().parents[2]
-    db_dir = repo_root / "database"
-
-    txs_path = db_dir / "data_decode_txs.csv"
-    rex_path = db_dir / "data_price_rex_usdc.csv"
-    fx_path  = db_dir / "data_price_usd_eur.csv"
-    out_path = db_dir / "data_tax_rex.csv"
-
-    # Read inputs
-    txs = read_csv_str(txs_path)
-    rex = read_csv_str(rex_path)
-    fx  = read_csv_str(fx_path)
-
-    # Validate
-    for name, df in [("data_decode_txs.csv", txs), ("data_price_rex_usdc.csv", rex), ("data_price_usd_eur.csv", fx)]:
-        if "tx_hash" not in df.columns:
-            raise ValueError(f"{name} is missing required column 'tx_hash'.")
-
+def read_table_str(path: Path, columns: list) -> "pa.Table":
+    """
+    read_csv_str as an Arrow table: every column string, empty cells "" (multithreaded parse).
+    The CSV is memory-mapped, so the parser reads the page cache without a buffered copy.
+    DICT_COLS are parsed dictionary-encoded (int32 indices into a few distinct strings).
+    """
+    dict_type = pa.dictionary(pa.int32(), pa.string())
+    with pa.memory_map(str(path), "r") as source:
+        table = pv.read_csv(
+            source,
+            parse_options=pv.ParseOptions(newlines_in_values=True),
+            convert_options=pv.ConvertOptions(
+                column_types={c: dict_type if c.strip() in DICT_COLS else pa.string() for c in columns},
+                include_columns=columns,
+                strings_can_be_null=False,
+            ),
+        )
+    return table.rename_columns([c.strip() for c in table.column_names])
+
+def merge_pandas(txs: pd.DataFrame, rex: pd.DataFrame, fx: pd.DataFrame) -> pd.DataFrame:
     # Deduplicate
     txs = txs.drop_duplicates(subset=["tx_hash"], keep="last")
     rex = rex.drop_duplicates(subset=["tx_hash"], keep="last")
@@ -69,17 +103,137 @@ def main():
         if col not in merged.columns:
             merged[col] = ""
 
-    final = merged[OUTPUT_COLS]
+    return merged[OUTPUT_COLS]
+
+def _row_ids(n: int) -> "pa.Array":
+    return pa.array(np.arange(n, dtype=np.int64))  # zero-copy from numpy, no Python ints
+
+def _last_per_hash(table: "pa.Table") -> "pa.Table":
+    """
+    drop_duplicates(subset=["tx_hash"], keep="last"): last row of each hash, in file order.
+    Only (tx_hash, row id) goes through the hash aggregation; the full rows are gathered once.
+    """
+    keys = pa.table({"tx_hash": table["tx_hash"], "_row": _row_ids(table.num_rows)})
+    keep = keys.group_by("tx_hash", use_threads=False).aggregate([("_row", "max")])["_row_max"]
+    return table.take(keep.sort())
+
+def read_dedup_table(path: Path, columns: list, cache_dir: Path) -> "pa.Table":
+    """
+    _last_per_hash(read_table_str(path, columns)), snapshotted as Arrow IPC in cache_dir.
+    The snapshot is stamped with the CSV's mtime/size and the column plan; while those match it
+    is memory-mapped instead of parsed. Any cache problem just means a normal parse.
+    """
+    snap = cache_dir / f"{path.name}.arrow"
+    st = path.stat()
+    stamp = {"mtime_ns": str(st.st_mtime_ns), "size": str(st.st_size), "columns": json.dumps(columns)}
+    try:
+        with pa.memory_map(str(snap)) as src:
+            table = pa.ipc.open_file(src).read_all()
+        meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+        if meta == stamp:
+            return table.replace_schema_metadata(None)
+    except Exception:
+        pass
+    table = _last_per_hash(read_table_str(path, columns))
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = snap.with_suffix(".arrow.tmp")
+        stamped = table.replace_schema_metadata(stamp)
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, stamped.schema) as writer:
+            writer.write_table(stamped)
+        os.replace(tmp, snap)
+    except Exception:
+        pass
+    return table
+
+def merge_arrow(txs: "pa.Table", rex: "pa.Table", fx: "pa.Table") -> "pa.Table":
+    """
+    merge_pandas on Arrow tables already deduplicated per tx_hash: same rows, same order, same columns.
+    Each txs hash is looked up once per side (index_in), so both joins become integer takes and
+    txs order is kept without a sort. A column name present in several inputs resolves to the
+    first one, as the unsuffixed name does after pandas' suffixes=("", "_rex"/"_fx").
+    Dictionary columns are gathered as indices and decoded to plain strings only for the output rows.
+    """
+    rex_idx = pc.index_in(txs["tx_hash"], value_set=rex["tx_hash"])
+    fx_idx = pc.index_in(txs["tx_hash"], value_set=fx["tx_hash"])
+    both = pc.and_(pc.is_valid(rex_idx), pc.is_valid(fx_idx))
+    cols = {}
+    for table in (txs.filter(both), rex.take(rex_idx.filter(both)), fx.take(fx_idx.filter(both))):
+        for name in table.column_names:
+            col = table[name]
+            if pa.types.is_dictionary(col.type):
+                col = col.cast(pa.string())
+            cols.setdefault(name, col)
+    empty = pa.array([""] * int(pc.sum(both).as_py() or 0), pa.string())
+    return pa.table([cols.get(c, empty) for c in OUTPUT_COLS], names=OUTPUT_COLS)
+
+def needs_quoting(table: "pa.Table") -> bool:
+    """True if any name or value holds a character pandas' QUOTE_MINIMAL would quote."""
+    if any(any(ch in name for ch in ',"\r\n') for name in table.column_names):
+        return True
+    return any(
+        pc.any(pc.match_substring_regex(col, r'[,"\r\n]')).as_py() for col in table.columns
+    )
+
+def write_csv_batches(table: "pa.Table", out_path: Path):
+    """final.to_csv(out_path, index=False) for an Arrow table, converting one batch at a time."""
+    if not needs_quoting(table):
+        # Arrow's C++ writer; unquoted + os.linesep matches pandas byte for byte here
+        opts = pv.WriteOptions(batch_size=OUT_BATCH_ROWS, eol=os.linesep,
+                               quoting_style="none", quoting_header="none")
+        pv.write_csv(table, str(out_path), write_options=opts)
+        return
+    # Arrow would quote every string ("needed"), so fall back to pandas for quoted fields
+    with out_path.open("w", newline="", encoding="utf-8") as f:
+        header = True
+        for batch in table.to_batches(max_chunksize=OUT_BATCH_ROWS):
+            batch.to_pandas().to_csv(f, index=False, header=header)
+            header = False
+        if header:  # no rows: header only
+            pd.DataFrame(columns=table.column_names).to_csv(f, index=False)
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    final.to_csv(out_path, index=False)
+def main():
+    print(f"Version: {VERSION}")
+
+    repo_root = Path(__file__).resolve().parents[2]
+    db_dir = repo_root / "database"
 
-    print(f"Wrote {len(final)} rows to {out_path}")
+    txs_path = db_dir / "data_decode_txs.csv"
+    rex_path = db_dir / "data_price_rex_usdc.csv"
+    fx_path  = db_dir / "data_price_usd_eur.csv"
+    out_path = db_dir / "data_tax_rex.csv"
+
+    # Validate
+    paths = [txs_path, rex_path, fx_path]
+    headers = [read_csv_header(p) for p in paths]
+    for p, header in zip(paths, headers):
+        if "tx_hash" not in [c.strip() for c in header]:
+            raise ValueError(f"{p.name} is missing required column 'tx_hash'.")
+
+    # Read only the columns that can reach the output, deduplicate, merge on tx_hash
+    # (Arrow tables when pyarrow is installed, else DataFrames)
+    plans = plan_columns(headers)
+    if pa is None:
+        txs, rex, fx = [read_csv_str(p, cols) for p, cols in zip(paths, plans)]
+        final = merge_pandas(txs, rex, fx)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        final.to_csv(out_path, index=False)
+        written = len(final)
+    else:
+        cache_dir = db_dir / CACHE_DIR_NAME
+        txs, rex, fx = [read_dedup_table(p, cols, cache_dir) for p, cols in zip(paths, plans)]
+        final = merge_arrow(txs, rex, fx)
+        del txs, rex, fx  # only final's columns stay referenced
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        write_csv_batches(final, out_path)
+        written = final.num_rows
+
+    print(f"Wrote {written} rows to {out_path}")
     print(f"Version: {VERSION}")
 
 if __name__ == "__main__":
     main()
 
 # ------------------------------------------------------------
-# Software Version (footer): 1.2.0
+# Software Version (footer): 1.12.0
 # ------------------------------------------------------------